@@ -0,0 +1,85 @@
+"""
+Simulated day of polling with a fixed interval vs the next_poll_ms hints server.main returns,
+in-process with fakeredis: request count and actuation error (seconds when the board state differs from the schedule).
+farm in both of its schedule modes and coco are the boards the sketches run, the rest are registry boards
+with one scheduled thing each. farm and coco take user overrides from /process at any time,
+so their hints are capped at CONFIG.poll_interval_ms
+    python -m bench.adaptive_poll --schedules 20
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from bench.asgi import use_fake_redis
+from config import CONFIG
+from server import main
+from server.registry import BoardConfig, Registry, ScheduleConfig, ThingConfig
+from server.schedule import create_schedule
+
+
+DAY = 86400
+MIDNIGHT = datetime(2022, 6, 1)
+
+
+async def simulate(name: str, bitmap: Optional[bytearray], adaptive: bool, start: float) -> Tuple[int, int]:
+    """
+    Polls in a day and seconds of wrong state, the board applies the required state on every poll
+    """
+    required = [bitmap[s // 60] for s in range(DAY)] if bitmap is not None else None
+    t, polls, error = start, 0, 0
+    while t < start + DAY:
+        now = MIDNIGHT + timedelta(seconds=t)
+        delay = await main.next_poll_ms(name, now) if adaptive else CONFIG.poll_interval_ms
+        end = min(t + delay / 1000, start + DAY)
+        if required is not None:
+            state = required[int(t) % DAY]
+            error += sum(1 for s in range(int(t), int(end)) if required[s % DAY] != state)
+        t, polls = end, polls + 1
+    return polls, error
+
+
+def registry_boards(count: int) -> Registry:
+    boards, schedules = {}, []
+    for i in range(1, count + 1):
+        work_time = random.randint(1, 30)
+        schedule = create_schedule(random.sample(range(24), random.randint(1, 24)),
+                                   work_time, random.randint(1, 60 - work_time))
+        schedules += [ScheduleConfig(i, hour, str(intervals)) for hour, intervals in schedule.items()]
+        name = f'board{i}'
+        boards[name] = BoardConfig(i, name, '', (ThingConfig(i, name, 'relay', 2, False, True, None, i),))
+    return Registry(boards, tuple(schedules))
+
+
+async def bench(schedules: int) -> None:
+    use_fake_redis(main)
+    main.registry.current = registry_boards(schedules)
+    main.on_registry_refresh(main.registry.current)
+
+    runs = [('farm', mode, main.schedule_bitmaps[mode]) for mode in main.schedule_bitmaps] + [('coco', None, None)]
+    runs += [(name, None, main.schedule_book.bitmaps[board.things[0].schedule_id])
+             for name, board in main.registry.current.boards.items()]
+    totals = {}
+    for name, mode, bitmap in runs:
+        if mode is not None:
+            await main.redis.hset('farm', 'custom', mode)
+            main.state_cache.invalidate()
+        group = 'sketch boards' if name in ('farm', 'coco') else 'scheduled boards'
+        start = random.uniform(0, 10)
+        for adaptive in (False, True):
+            polls, error = await simulate(name, bitmap, adaptive, start)
+            total = totals.setdefault((group, adaptive), [0, 0, 0])
+            total[0] += polls
+            total[1] += error
+            total[2] += 1
+    for (group, adaptive), (polls, error, boards) in totals.items():
+        print(f'{group:>16} {"adaptive" if adaptive else "fixed":>8}: {polls / boards:7.0f} polls per board per day, '
+              f'{error / boards:6.0f} s of wrong state per board per day')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedules', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(bench(args.schedules))
@@ -0,0 +1,62 @@
+"""
+In-process ASGI client for benchmarks, no sockets involved
+"""
+from typing import Dict, Iterable, Tuple
+
+
+async def request(app,
+                  method: str,
+                  path: str,
+                  body: bytes = b'',
+                  headers: Iterable[Tuple[str, str]] = ()) -> Tuple[int, Dict[str, str], bytes]:
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(key.lower().encode(), value.encode()) for key, value in headers]
+                   + [(b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    status = 0
+    response_headers: Dict[str, str] = {}
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            response_headers.update({key.decode(): value.decode() for key, value in message['headers']})
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return status, response_headers, b''.join(chunks)
+
+
+def use_fake_redis(main) -> None:
+    """
+    Replace redis client of server.main with fakeredis (pip install -r requirements-dev.txt)
+    """
+    import fakeredis.aioredis
+
+    fake = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    main.redis = fake
+    main.state_cache.redis = fake
+    main.triggers.store.redis = fake
+    main.registry.redis = fake
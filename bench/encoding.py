@@ -0,0 +1,41 @@
+"""
+JSON vs msgpack /interact: requests per second in-process (fakeredis) and bytes per poll
+    python -m bench.encoding --requests 5000
+"""
+import argparse
+import asyncio
+import json
+from time import perf_counter
+
+import msgpack
+
+from bench.asgi import request, use_fake_redis
+from server import main
+
+
+async def run(name: str, body: bytes, content_type: str, requests: int) -> None:
+    headers = [('content-type', content_type)]
+    status, _, response = await request(main.app, 'POST', '/interact', body, headers)
+    assert status == 200, (status, response)
+    started = perf_counter()
+    for _ in range(requests):
+        await request(main.app, 'POST', '/interact', body, headers)
+    elapsed = perf_counter() - started
+    print(f'{name:>8}: {requests / elapsed:8.0f} req/s, '
+          f'request {len(body)} B, response {len(response)} B per poll')
+
+
+async def bench(requests: int) -> None:
+    use_fake_redis(main)
+    for board, data in [('farm', {'LED': 1}), ('coco', {'led_temp': 23.5})]:
+        print(board)
+        json_body = json.dumps({'name': board, **data}, separators=(',', ':')).encode()
+        await run('json', json_body, 'application/json', requests)
+        await run('msgpack', msgpack.packb([board, 0, data]), 'application/msgpack', requests)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests))
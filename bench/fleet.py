@@ -0,0 +1,151 @@
+"""
+Fleet of simulated ESP8266 boards polling /interact, farm-style (reports LED) and coco-style (reports led_temp).
+In-process against server.main with fakeredis by default, or over HTTP against a running server with --url
+    python -m bench.fleet --boards 1000 --interval 10 --duration 60
+    python -m bench.fleet --boards 1000 --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import random
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import msgpack
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, kind: str, latency: float, ok: bool) -> None:
+        if ok:
+            self.latencies.setdefault(kind, []).append(latency)
+        else:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def report(self, elapsed: float) -> None:
+        print(f'{"board":>6} {"requests":>9} {"req/s":>8} {"p50, ms":>8} {"p99, ms":>8} {"errors":>7}')
+        for kind in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(kind, []))
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else float('nan')
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+            print(f'{kind:>6} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} '
+                  f'{p50:>8.2f} {p99:>8.2f} {self.errors.get(kind, 0):>7}')
+
+
+async def http_post(url: str, body: bytes, content_type: str) -> Tuple[int, bytes]:
+    """
+    One connection per request, like ESP8266HTTPClient in the sketches
+    """
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        writer.write(f'POST {parts.path or "/"} HTTP/1.1\r\n'
+                     f'Host: {parts.netloc}\r\n'
+                     f'Content-Type: {content_type}\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1]) if head else 0
+    if b'transfer-encoding: chunked' in head.lower():
+        chunks, rest = [], payload
+        while rest:
+            size, _, rest = rest.partition(b'\r\n')
+            size = int(size, 16)
+            if size == 0:
+                break
+            chunks.append(rest[:size])
+            rest = rest[size + 2:]
+        payload = b''.join(chunks)
+    return status, payload
+
+
+async def board(kind: str,
+                post,
+                stats: Stats,
+                args: argparse.Namespace,
+                stop_at: float) -> None:
+    rng = random.Random()
+    led, temp = 0, rng.uniform(18, 26)
+    # Boards are not switched on at the same moment
+    await asyncio.sleep(rng.uniform(0, args.interval))
+    while perf_counter() < stop_at:
+        if kind == 'farm':
+            data = {'LED': led}
+        else:
+            temp += rng.gauss(0, args.noise)
+            data = {'led_temp': round(temp, 2)}
+        if args.msgpack:
+            body, content_type = msgpack.packb([kind, 0, data]), 'application/msgpack'
+        else:
+            body, content_type = json.dumps({'name': kind, **data}).encode(), 'application/json'
+
+        started = perf_counter()
+        try:
+            status, payload = await post(body, content_type)
+        except Exception:
+            # Connection errors over HTTP, unhandled server errors in-process
+            status, payload = 0, b''
+        stats.add(kind, perf_counter() - started, status == 200)
+
+        delay = args.interval
+        if status == 200:
+            if args.msgpack:
+                _, states = msgpack.unpackb(payload)
+            else:
+                states = json.loads(payload)
+            led = states.get('LED', led)
+            if args.hints and 'next_poll_ms' in states:
+                delay = states['next_poll_ms'] / 1000
+        delay = delay + rng.uniform(-args.jitter, args.jitter)
+        await asyncio.sleep(max(min(delay, stop_at - perf_counter()), 0))
+
+
+async def run(args: argparse.Namespace) -> Stats:
+    if args.url:
+        url = args.url.rstrip('/') + '/interact'
+
+        async def post(body: bytes, content_type: str) -> Tuple[int, bytes]:
+            return await http_post(url, body, content_type)
+    else:
+        from bench.asgi import request, use_fake_redis
+        from server import main
+        use_fake_redis(main)
+
+        async def post(body: bytes, content_type: str) -> Tuple[int, bytes]:
+            status, _, payload = await request(main.app, 'POST', '/interact', body, [('content-type', content_type)])
+            return status, payload
+
+    stats = Stats()
+    started = perf_counter()
+    stop_at = started + args.duration
+    coco = int(args.boards * args.coco_share)
+    kinds = ['coco'] * coco + ['farm'] * (args.boards - coco)
+    await asyncio.gather(*(board(kind, post, stats, args, stop_at) for kind in kinds))
+    stats.report(perf_counter() - started)
+    return stats
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', type=int, default=1000)
+    parser.add_argument('--coco-share', type=float, default=0.5, help='share of coco-style boards')
+    parser.add_argument('--interval', type=float, default=10, help='poll interval, s')
+    parser.add_argument('--jitter', type=float, default=0.5, help='random poll interval deviation, s')
+    parser.add_argument('--noise', type=float, default=0.1, help='std of temperature random walk step')
+    parser.add_argument('--duration', type=float, default=60, help='s')
+    parser.add_argument('--hints', action='store_true', help='honour next_poll_ms')
+    parser.add_argument('--msgpack', action='store_true')
+    parser.add_argument('--url', help='server to test over HTTP, in-process with fakeredis if not set')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
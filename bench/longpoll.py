@@ -0,0 +1,48 @@
+"""
+How many boards one worker can hold parked on /interact/wait, in-process with fakeredis.
+Parks N requests, reports memory per parked request, then wakes them all with one /process call
+    python -m bench.longpoll --boards 10000
+"""
+import argparse
+import asyncio
+import json
+import tracemalloc
+from time import perf_counter
+
+from bench.asgi import request, use_fake_redis
+from server import main
+
+
+async def bench(boards: int) -> None:
+    use_fake_redis(main)
+    body = json.dumps({'name': 'coco', 'coco_led': 1, 'led_temp': 20.0}).encode()
+    headers = [('content-type', 'application/json')]
+    await request(main.app, 'POST', '/process', b'coco_led=1', [('content-type', 'text/plain')])
+    # Warm up the state cache, so parked requests don't hit redis
+    await request(main.app, 'POST', '/interact', body, headers)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    parked = [asyncio.create_task(request(main.app, 'POST', '/interact/wait', body, headers))
+              for _ in range(boards)]
+    # Let every request reach notifier.wait()
+    await asyncio.sleep(1)
+    after = tracemalloc.take_snapshot()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    tracemalloc.stop()
+    print(f'parked {boards} requests, {size / boards / 1024:.1f} KiB per parked request')
+
+    started = perf_counter()
+    await request(main.app, 'POST', '/process', b'coco_led=0', [('content-type', 'text/plain')])
+    responses = await asyncio.gather(*parked)
+    elapsed = perf_counter() - started
+    woken = sum(1 for status, _, response in responses
+                if status == 200 and json.loads(response)['coco_led'] == 0)
+    print(f'woke {woken}/{boards} boards in {elapsed * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(bench(args.boards))
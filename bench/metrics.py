@@ -0,0 +1,42 @@
+"""
+Overhead of the request-path instrumentation: what one /interact poll records, and /metrics rendering
+    python -m bench.metrics --iterations 200000 --boards 1000
+"""
+import argparse
+from time import perf_counter
+
+from server.metrics import Metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200_000)
+    parser.add_argument('--boards', type=int, default=1000)
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    boards = [f'board{i}' for i in range(args.boards)]
+
+    started = perf_counter()
+    for i in range(args.iterations):
+        # Same calls as one cached /interact poll: 3 stage timers, total latency, cache hit counter, last seen
+        with metrics.timer('interact', 'parse'):
+            pass
+        with metrics.timer('interact', 'decide'):
+            pass
+        with metrics.timer('interact', 'next_poll'):
+            pass
+        metrics.histogram('interact', 'total').observe(0.001)
+        metrics.inc('state_cache_total', result='hit')
+        metrics.seen(boards[i % len(boards)])
+    per_poll = (perf_counter() - started) / args.iterations
+    print(f'instrumentation: {per_poll * 1e6:.2f} us per poll')
+
+    started = perf_counter()
+    text = metrics.render()
+    print(f'/metrics render: {(perf_counter() - started) * 1000:.1f} ms, {len(text) / 1024:.0f} KiB '
+          f'for {args.boards} boards')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Result publishing through server.publisher.Publisher against an in-process broker stand-in
+with a fixed send latency and a share of failing sends.
+Reports how long producers are blocked per publish and the end-to-end throughput
+    python -m bench.publisher --messages 10000 --latency-ms 1 --failures 0.01
+"""
+import argparse
+import random
+import threading
+from time import perf_counter, sleep
+
+from server.publisher import Publisher
+
+
+class Broker:
+    def __init__(self, latency_ms: float, failures: float):
+        self.latency = latency_ms / 1000
+        self.failures = failures
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def send(self, message: str) -> None:
+        sleep(self.latency)
+        if random.random() < self.failures:
+            raise ConnectionError('broker unavailable')
+        with self.lock:
+            self.received += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--latency-ms', type=float, default=1)
+    parser.add_argument('--failures', type=float, default=0.01, help='share of failing sends')
+    parser.add_argument('--payload-kb', type=int, default=10)
+    args = parser.parse_args()
+
+    broker = Broker(args.latency_ms, args.failures)
+    publisher = Publisher(broker.send, max_queue=args.messages, backoff_ms=1)
+    payload = {'id': 0, 'type': 'calc_grp', 'data': {'grid': 'x' * args.payload_kb * 1024}}
+
+    publisher.start()
+    started = perf_counter()
+    for i in range(args.messages):
+        publisher.publish({**payload, 'id': i})
+    blocked = perf_counter() - started
+    publisher.stop(timeout=3600)
+    elapsed = perf_counter() - started
+
+    print(f'producer blocked: {blocked / args.messages * 1e6:.1f} us per publish')
+    print(f'delivered {broker.received} of {args.messages} in {elapsed:.1f} s, '
+          f'{broker.received / elapsed:.0f} msg/s, dropped {publisher.dropped}, failed {publisher.failed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Raw vs rollup query latency over a synthetic year of data, needs a running InfluxDB (see config.py)
+    python -m bench.rollups --sensors 100 --raw-interval 600
+"""
+import argparse
+import math
+import random
+from time import perf_counter, time
+
+from influxdb import InfluxDBClient
+
+from config import CONFIG
+from db.tsdb.rollups import RESOLUTIONS, backfill, setup_rollups
+from db.tsdb.telemetry import to_line
+
+
+YEAR = 365 * 86400
+
+
+def fill(client: InfluxDBClient, database: str, sensors: int, raw_interval: int, end: int) -> int:
+    start = end - YEAR
+    batch, count = [], 0
+    for sensor in range(sensors):
+        phase = random.random() * math.pi
+        for ts in range(start, end, raw_interval):
+            value = 20 + 5 * math.sin(2 * math.pi * ts / 86400 + phase) + random.gauss(0, 0.5)
+            batch.append(to_line('bench_temp', {'sensor': f's{sensor}'}, {'value': value}, ts * 1000))
+            if len(batch) == 10_000:
+                client.write_points(batch, database=database, time_precision='ms', protocol='line')
+                count += len(batch)
+                batch = []
+    if batch:
+        client.write_points(batch, database=database, time_precision='ms', protocol='line')
+        count += len(batch)
+    return count
+
+
+def timed(client: InfluxDBClient, database: str, query: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = perf_counter()
+        client.query(query, database=database, epoch='s')
+        best = min(best, perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default=CONFIG.tsdb_database + '_bench')
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--raw-interval', type=int, default=600)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-fill', action='store_true')
+    args = parser.parse_args()
+
+    client = InfluxDBClient(host=CONFIG.hostname,
+                            port=CONFIG.tsdb_port,
+                            username=CONFIG.tsdb_username,
+                            password=CONFIG.tsdb_password)
+    end = int(time()) // 86400 * 86400
+    if not args.skip_fill:
+        client.drop_database(args.database)
+        setup_rollups(client, args.database, raw_retention='INF')
+        started = perf_counter()
+        count = fill(client, args.database, args.sensors, args.raw_interval, end)
+        print(f'written {count} raw points in {perf_counter() - started:.1f} s')
+        started = perf_counter()
+        backfill(client, end - YEAR, end, args.database)
+        print(f'backfilled rollups in {perf_counter() - started:.1f} s')
+
+    print(f'{"range":>6} {"bucket":>6} {"raw, ms":>10} {"rollup, ms":>11}')
+    for days, resolution in [(1, RESOLUTIONS[1]), (30, RESOLUTIONS[2]), (365, RESOLUTIONS[3])]:
+        where = f'WHERE time >= {end - days * 86400}s AND time < {end}s'
+        group = f'GROUP BY time({resolution.interval_sec}s), "sensor"'
+        raw = timed(client, args.database,
+                    f'SELECT mean("value"), min("value"), max("value") '
+                    f'FROM "{args.database}"."autogen"."bench_temp" {where} {group}',
+                    args.repeat)
+        rollup = timed(client, args.database,
+                       f'SELECT "mean", "min", "max" '
+                       f'FROM "{args.database}"."{resolution.retention_policy}"."bench_temp" {where}',
+                       args.repeat)
+        print(f'{days:>5}d {resolution.name:>6} {raw:>10.1f} {rollup:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
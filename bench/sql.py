@@ -0,0 +1,84 @@
+"""
+Sync vs async SQLAlchemy under concurrent requests, on a temporary SQLite database.
+Besides throughput reports event loop lag, which is what every /interact poll waits for
+    python -m bench.sql --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+from time import perf_counter
+from typing import List
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from db.sql import crud, models
+from db.sql.database import Base
+
+
+async def measure_lag(stop: asyncio.Event, lags: List[float], period: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(period)
+        lags.append(loop.time() - started - period)
+
+
+async def run(name: str, handler, requests: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    lags: List[float] = []
+    lag_task = asyncio.create_task(measure_lag(stop, lags))
+
+    async def request():
+        async with semaphore:
+            await handler()
+
+    started = perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = perf_counter() - started
+    stop.set()
+    await lag_task
+    lags.sort()
+    max_lag = lags[-1] * 1000 if lags else float('nan')
+    print(f'{name:>6}: {requests / elapsed:8.0f} req/s, event loop lag max {max_lag:.1f} ms')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--boards', type=int, default=100)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    sync_engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    AsyncSessionBench = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with AsyncSessionBench() as db:
+        await crud.bulk_insert(db, models.Board, [{'name': f'board{i}', 'description': ''}
+                                                  for i in range(args.boards)])
+        await crud.bulk_insert(db, models.Thing, [{'board_id': i + 1, 'equipment_name': 'LED', 'pin': i,
+                                                   'is_writable': True} for i in range(args.boards)])
+
+    async def sync_handler():
+        # Blocking ORM call inside an async handler
+        with Session(sync_engine) as db:
+            db.query(models.Board).all()
+
+    async def async_handler():
+        async with AsyncSessionBench() as db:
+            await crud.get_boards(db)
+
+    await run('sync', sync_handler, args.requests, args.concurrency)
+    await run('async', async_handler, args.requests, args.concurrency)
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
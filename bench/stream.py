@@ -0,0 +1,68 @@
+"""
+Dashboard stream fan-out: memory per subscriber and delivery time of a delta to all of them
+    python -m bench.stream --subscribers 500 --boards 100
+"""
+import argparse
+import asyncio
+import random
+import tracemalloc
+from time import perf_counter
+from typing import Dict, List
+
+from server.stream import StateStream
+
+
+async def bench(subscribers: int, boards: int, ticks: int) -> None:
+    states: Dict[str, Dict[str, str]] = {f'board{i}': {'temp': '20.0', 'LED': '0'} for i in range(boards)}
+    loads = 0
+
+    async def load(board: str) -> Dict[str, str]:
+        nonlocal loads
+        loads += 1
+        return states[board]
+
+    stream = StateStream(load, fps=1000)
+    producer = asyncio.create_task(stream.run())
+    received: List[int] = [0] * subscribers
+    delivered = asyncio.Event()
+
+    async def client(i: int) -> None:
+        async for frame in stream.subscribe(set(states)):
+            received[i] += 1
+            if all(received):
+                delivered.set()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    clients = [asyncio.create_task(client(i)) for i in range(subscribers)]
+    await delivered.wait()
+    after = tracemalloc.take_snapshot()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    tracemalloc.stop()
+    print(f'{subscribers} subscribers, {size / subscribers / 1024:.1f} KiB per subscriber')
+
+    loads = 0
+    started = perf_counter()
+    for _ in range(ticks):
+        expected = [count + 1 for count in received]
+        for board in random.sample(list(states), k=max(1, boards // 10)):
+            states[board] = {**states[board], 'temp': f'{random.uniform(15, 25):.1f}'}
+            stream.mark(board)
+        while received != expected:
+            await asyncio.sleep(0)
+    elapsed = perf_counter() - started
+    print(f'{ticks} ticks to every subscriber in {elapsed * 1000 / ticks:.2f} ms per tick, '
+          f'{loads / ticks:.0f} state reads per tick')
+
+    for task in clients + [producer]:
+        task.cancel()
+    await asyncio.gather(*clients, producer, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--boards', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(bench(args.subscribers, args.boards, args.ticks))
@@ -1,3 +1,6 @@
+import os
+
+
 class CONFIG:
     root_dir = ''
     hostname = 'localhost'
@@ -7,3 +10,51 @@ class CONFIG:
     tsdb_password = 'pass'
     redis_url = 'redis://localhost'
     redis_port = 6379
+    states_channel = 'states'
+    state_cache_ttl = 30
+    tsdb_database = 'homefarm'
+    telemetry_batch_size = 500
+    telemetry_flush_ms = 1000
+    telemetry_buffer_size = 100_000
+    raw_interval_sec = 10
+    registry_channel = 'registry'
+    sql_pool_size = 10
+    sql_max_overflow = 20
+    long_poll_timeout = 30
+    stream_fps = 5
+    stream_max_queue = 50
+    stream_keepalive_sec = 15
+    poll_interval_ms = 10_000
+    min_poll_ms = 1_000
+    max_poll_ms = 60_000
+    poll_slack_ms = 500
+    workers = 1
+    leader_key = 'leader'
+    leader_ttl_ms = 10_000
+    readings_channel = 'readings'
+    active_triggers_key = 'triggers:active'
+    trigger_overrides_key = 'triggers:overrides'
+    grid_processes = os.cpu_count()
+    grid_chunks = 4 * (os.cpu_count() or 1)
+    grid_chunk_points = 200_000
+    grid_in_flight = 2 * (os.cpu_count() or 1)
+    grid_jobs = 2
+    grid_jobs_history = 1000
+    cache_lifetime_sec = 3600
+    cache_max_bytes = 10 * 2**30
+    cache_sweep_sec = 60
+    process_workers = 8
+    publish_queue_size = 10_000
+    publish_batch_size = 100
+    publish_retries = 5
+    publish_backoff_ms = 100
+    traceback_frames = 5
+    codec_cache_size = 1024
+    wells_cache_size = 16
+    analogues_cache_size = 1024
+    journal_dir = 'db/state'
+    journal_compact_bytes = 1_000_000
+    journal_compact_sec = 300
+    journal_keep_segments = 10
+    # Set in redis along with the restored states, missing only when redis lost its data
+    journal_restored_key = 'journal:restored'
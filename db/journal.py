@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import struct
+from collections import deque
+from time import time, time_ns
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import msgpack
+
+from config import CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+# Every record is prefixed with its length
+HEADER = struct.Struct('>I')
+LOG = 'journal.log'
+SNAPSHOT = 'snapshot.msgpack'
+# Kept in the history, but not in the restored states: values set by triggers are released by their timers,
+# a value restored without its trigger would never be released
+VOLATILE_SOURCES = frozenset({'trigger'})
+
+
+def encode_record(board: str, fields: Dict[str, Any], source: str, timestamp: Optional[float] = None) -> bytes:
+    body = msgpack.packb([time() if timestamp is None else timestamp, board, fields, source])
+    return HEADER.pack(len(body)) + body
+
+
+def read_records(path: str) -> Iterator[List[Any]]:
+    """
+    [timestamp, board, fields, source] records of the file. A torn record at the end (crash mid-write) is skipped
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        (size,) = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + size
+        if end > len(data):
+            logger.warning(f'Torn record at {offset} in {path}')
+            return
+        yield msgpack.unpackb(data[offset + HEADER.size:end])
+        offset = end
+
+
+def fold_records(states: Dict[str, Dict[str, Any]], path: str) -> None:
+    """
+    Apply records of the file to states, except the ones of VOLATILE_SOURCES
+    """
+    for _, board, fields, source in read_records(path):
+        if source not in VOLATILE_SOURCES:
+            states.setdefault(board, {}).update(fields)
+
+
+class StateJournal:
+    """
+    Append-only log of board state changes (user overrides, triggers, defaults) shared by all the workers.
+    record() only queues the record, a background task of every worker writes the queue in the default executor,
+    as a single O_APPEND write, so workers don't interleave.
+    Compaction moves the log to a segment named by time and folds it into the snapshot,
+    the last keep_segments segments are kept as audit history
+    """
+    def __init__(self,
+                 directory: str = CONFIG.journal_dir,
+                 compact_bytes: int = CONFIG.journal_compact_bytes,
+                 keep_segments: int = CONFIG.journal_keep_segments):
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self.keep_segments = keep_segments
+        self.log_path = os.path.join(directory, LOG)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT)
+        os.makedirs(directory, exist_ok=True)
+        self._pending: Deque[bytes] = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, board: str, fields: Dict[str, Any], source: str) -> None:
+        self._pending.append(encode_record(board, fields, source))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _write(self, data: bytes) -> None:
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    async def flush(self) -> None:
+        """
+        Write queued records. On failure they are kept and written by the next flush
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return
+            count = len(self._pending)
+            data = b''.join(self._pending)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+            except Exception:
+                logger.exception(f'Failed to write {count} records to the state journal')
+                return
+            for _ in range(count):
+                self._pending.popleft()
+
+    async def run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+            if self._pending:
+                # Failed write, retry later
+                await asyncio.sleep(1)
+                self._wakeup.set()
+
+    def start(self) -> asyncio.Task:
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and write what is left
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    def segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith('journal.') and name != LOG and name.endswith('.log'))
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                return msgpack.unpackb(f.read())
+        except FileNotFoundError:
+            return {'segment': '', 'states': {}}
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Latest states of the boards: snapshot, then segments not folded into it yet, then the log.
+        A field recorded as None was deleted, records of VOLATILE_SOURCES are skipped
+        """
+        snapshot = self._read_snapshot()
+        states = snapshot['states']
+        paths = [os.path.join(self.directory, name) for name in self.segments() if name > snapshot['segment']]
+        for path in paths + [self.log_path]:
+            fold_records(states, path)
+        return {board: {field: value for field, value in fields.items() if value is not None}
+                for board, fields in states.items()}
+
+    def history(self, board: Optional[str] = None) -> Iterator[List[Any]]:
+        """
+        Records of the kept segments and the log, oldest first
+        """
+        paths = [os.path.join(self.directory, name) for name in self.segments()]
+        for path in paths + [self.log_path]:
+            for record in read_records(path):
+                if board is None or record[1] == board:
+                    yield record
+
+    def compact(self) -> bool:
+        """
+        Fold the log into the snapshot. False if the log is too small to bother
+        """
+        try:
+            if os.path.getsize(self.log_path) < self.compact_bytes:
+                return False
+        except FileNotFoundError:
+            return False
+        segment = f'journal.{time_ns():020d}.log'
+        # Workers open the log per record, the next one creates a new file
+        os.replace(self.log_path, os.path.join(self.directory, segment))
+        snapshot = self._read_snapshot()
+        states = snapshot['states']
+        for name in self.segments():
+            if snapshot['segment'] < name <= segment:
+                fold_records(states, os.path.join(self.directory, name))
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(msgpack.packb({'segment': segment, 'states': states}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        for name in self.segments()[:-self.keep_segments or None]:
+            os.remove(os.path.join(self.directory, name))
+        return True
+
+    async def run_compaction(self, interval_sec: float = CONFIG.journal_compact_sec) -> None:
+        """
+        Leader only: compaction is not safe to run from two workers at once
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval_sec)
+            try:
+                await loop.run_in_executor(None, self.compact)
+            except Exception:
+                logger.exception('State journal compaction failed')
@@ -0,0 +1,135 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Type
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models
+from .database import Base
+
+
+logger = logging.getLogger(__name__)
+# Called after every committed write, e.g. to make the workers reload the configuration
+_commit_hooks: List[Callable[[], Awaitable[None]]] = []
+
+
+def on_commit(callback: Callable[[], Awaitable[None]]) -> None:
+    _commit_hooks.append(callback)
+
+
+async def commit(db: AsyncSession) -> None:
+    """
+    Commit and run the hooks. The write is done even if a hook fails
+    """
+    await db.commit()
+    for callback in _commit_hooks:
+        try:
+            await callback()
+        except Exception:
+            logger.exception('Commit hook failed')
+
+
+async def get_boards(db: AsyncSession) -> List[models.Board]:
+    result = await db.execute(select(models.Board).options(selectinload(models.Board.things)))
+    return result.scalars().all()
+
+
+async def get_board(db: AsyncSession, name: str) -> Optional[models.Board]:
+    result = await db.execute(select(models.Board)
+                              .where(models.Board.name == name)
+                              .options(selectinload(models.Board.things)))
+    return result.scalars().first()
+
+
+async def create_board(db: AsyncSession, name: str, description: Optional[str] = None) -> models.Board:
+    board = models.Board(name=name, description=description)
+    db.add(board)
+    await commit(db)
+    return board
+
+
+async def get_things(db: AsyncSession, board_id: Optional[int] = None) -> List[models.Thing]:
+    query = select(models.Thing)
+    if board_id is not None:
+        query = query.where(models.Thing.board_id == board_id)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def create_thing(db: AsyncSession, **fields) -> models.Thing:
+    thing = models.Thing(**fields)
+    db.add(thing)
+    await commit(db)
+    return thing
+
+
+async def get_schedules(db: AsyncSession) -> List[models.Schedule]:
+    result = await db.execute(select(models.Schedule))
+    return result.scalars().all()
+
+
+async def create_schedule(db: AsyncSession,
+                          list_of_tuple_minutes: str,
+                          hour: Optional[int] = None,
+                          desc: Optional[str] = None) -> models.Schedule:
+    schedule = models.Schedule(desc=desc, hour=hour, list_of_tuple_minutes=list_of_tuple_minutes)
+    db.add(schedule)
+    await commit(db)
+    return schedule
+
+
+async def get_triggers(db: AsyncSession) -> List[models.Triggers]:
+    result = await db.execute(select(models.Triggers))
+    return result.scalars().all()
+
+
+async def create_trigger(db: AsyncSession, **fields) -> models.Triggers:
+    trigger = models.Triggers(**fields)
+    db.add(trigger)
+    await commit(db)
+    return trigger
+
+
+async def delete_by_id(db: AsyncSession, model: Type[Base], id: int) -> int:
+    result = await db.execute(delete(model).where(model.id == id))
+    await commit(db)
+    return result.rowcount
+
+
+async def bulk_insert(db: AsyncSession, model: Type[Base], rows: Sequence[Dict[str, Any]]) -> None:
+    """
+    Insert rows with a single executemany, no ORM objects are created
+    """
+    if not rows:
+        return
+    await db.execute(insert(model), list(rows))
+    await commit(db)
+
+
+async def upsert(db: AsyncSession,
+                 model: Type[Base],
+                 rows: Sequence[Dict[str, Any]],
+                 index_elements: Sequence[str] = ('id',)) -> None:
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE for SQLite and PostgreSQL.
+    All rows must have the same keys
+    """
+    if not rows:
+        return
+    dialect = db.bind.dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(model)
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(model)
+    else:
+        raise NotImplementedError(f'Upsert is not supported for {dialect}')
+    columns = [column for column in rows[0] if column not in index_elements]
+    if columns:
+        statement = statement.on_conflict_do_update(index_elements=list(index_elements),
+                                                    set_={column: statement.excluded[column] for column in columns})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=list(index_elements))
+    await db.execute(statement, list(rows))
+    await commit(db)
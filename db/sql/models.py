@@ -26,6 +26,7 @@ class Thing(Base):
     equipment_desc = Column(String)
     tsdb_tag = Column(String, unique=True)
     schedule_id = Column(Integer, ForeignKey('schedules.id'))
+    board_id = Column(Integer, ForeignKey('boards.id'))
 
     board = relationship("Board", back_populates="things")
 
@@ -0,0 +1,113 @@
+from time import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from influxdb import InfluxDBClient
+
+from config import CONFIG
+
+
+class Resolution(NamedTuple):
+    name: str
+    interval_sec: int
+    retention_policy: str
+    retention: str  # InfluxQL duration, INF - keep forever
+    retention_sec: float
+
+
+# From the finest to the coarsest. Raw points are written by TelemetryWriter into the default policy
+RAW = Resolution('raw', CONFIG.raw_interval_sec, 'autogen', '7d', 7 * 86400)
+RESOLUTIONS: List[Resolution] = [
+    RAW,
+    Resolution('1m', 60, 'rp_1m', '90d', 90 * 86400),
+    Resolution('1h', 3600, 'rp_1h', '730d', 730 * 86400),
+    Resolution('1d', 86400, 'rp_1d', 'INF', float('inf')),
+]
+
+
+def _source(database: str, resolution: Resolution) -> str:
+    return f'"{database}"."{resolution.retention_policy}"'
+
+
+def _rollup_select(database: str, source: Resolution, target: Resolution) -> str:
+    # Raw points have `value`, rollups already have mean/min/max
+    if source is RAW:
+        fields = 'mean("value") AS "mean", min("value") AS "min", max("value") AS "max"'
+    else:
+        fields = 'mean("mean") AS "mean", min("min") AS "min", max("max") AS "max"'
+    return (f'SELECT {fields} INTO {_source(database, target)}.:MEASUREMENT '
+            f'FROM {_source(database, source)}./.*/')
+
+
+def setup_rollups(client: InfluxDBClient,
+                  database: str = CONFIG.tsdb_database,
+                  raw_retention: str = RAW.retention) -> None:
+    """
+    Create database, retention policies and continuous queries 1m <- raw, 1h <- 1m, 1d <- 1h
+    with mean/min/max aggregates of every measurement, grouped by all tags
+    """
+    client.create_database(database)
+    client.query(f'ALTER RETENTION POLICY "autogen" ON "{database}" DURATION {raw_retention}', method='POST')
+    for source, target in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        client.query(f'CREATE RETENTION POLICY "{target.retention_policy}" ON "{database}" '
+                     f'DURATION {target.retention} REPLICATION 1', method='POST')
+        client.query(f'CREATE CONTINUOUS QUERY "cq_{target.name}" ON "{database}" BEGIN '
+                     f'{_rollup_select(database, source, target)} '
+                     f'GROUP BY time({target.interval_sec}s), * END', method='POST')
+
+
+def backfill(client: InfluxDBClient,
+             start: float,
+             end: float,
+             database: str = CONFIG.tsdb_database) -> None:
+    """
+    Compute rollups for [start, end) unix seconds, e.g. for points written before continuous queries existed
+    """
+    for source, target in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        client.query(f'{_rollup_select(database, source, target)} '
+                     f'WHERE time >= {int(start)}s AND time < {int(end)}s '
+                     f'GROUP BY time({target.interval_sec}s), *',
+                     database=database,
+                     method='POST')
+
+
+def choose_resolution(start: float,
+                      end: float,
+                      max_points: int,
+                      now: Optional[float] = None) -> Resolution:
+    """
+    The finest resolution which is still retained at `start` and gives no more than max_points for the range
+    """
+    now = now or time()
+    for resolution in RESOLUTIONS:
+        if now - start > resolution.retention_sec:
+            continue
+        if (end - start) / resolution.interval_sec <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def query_history(client: InfluxDBClient,
+                  measurement: str,
+                  start: float,
+                  end: float,
+                  max_points: int = 1000,
+                  tags: Optional[Dict[str, str]] = None,
+                  database: str = CONFIG.tsdb_database) -> Tuple[str, List[Dict]]:
+    """
+    Get history of the measurement for [start, end) unix seconds, at most max_points per series.
+    Returns resolution name and list of points {time, mean, min, max}
+    """
+    resolution = choose_resolution(start, end, max_points)
+    if resolution is RAW:
+        fields = '"value" AS "mean", "value" AS "min", "value" AS "max"'
+    else:
+        fields = '"mean", "min", "max"'
+    conditions = [f'time >= {int(start)}s', f'time < {int(end)}s']
+    bind_params = {}
+    for i, (tag, value) in enumerate((tags or {}).items()):
+        conditions.append(f'"{tag}" = $tag{i}')
+        bind_params[f'tag{i}'] = value
+    query = (f'SELECT {fields} FROM {_source(database, resolution)}."{measurement}" '
+             f'WHERE {" AND ".join(conditions)}')
+    result = client.query(query, database=database, bind_params=bind_params, epoch='s')
+    return resolution.name, list(result.get_points())
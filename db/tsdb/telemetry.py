@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+from collections import deque
+from functools import partial
+from time import time
+from typing import Any, Deque, Dict, List, Optional
+
+from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError
+
+from config import CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str, chars: str) -> str:
+    value = value.replace('\\', '\\\\')
+    for char in chars:
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+def _field_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            # Not representable in line protocol, InfluxDB would reject the whole batch
+            raise ValueError(f'Non-finite field value {value}')
+        return repr(value)
+    return '"' + _escape(str(value), '"') + '"'
+
+
+def to_line(measurement: str,
+            tags: Dict[str, Any],
+            fields: Dict[str, Any],
+            timestamp_ms: Optional[int] = None) -> str:
+    """
+    Format point as InfluxDB line protocol with ms precision:
+        measurement,tag1=val1 field1=val1,field2=val2 timestamp
+    ValueError for NaN and infinite floats
+    """
+    line = _escape(measurement, ', ')
+    for key in sorted(tags):
+        line += f",{_escape(str(key), ', =')}={_escape(str(tags[key]), ', =')}"
+    line += ' ' + ','.join(f"{_escape(str(key), ', =')}={_field_value(value)}" for key, value in fields.items())
+    if timestamp_ms is None:
+        timestamp_ms = int(time() * 1000)
+    return f'{line} {timestamp_ms}'
+
+
+class TelemetryWriter:
+    """
+    Bounded ring buffer of sensor points flushed to InfluxDB by a background task,
+    every flush_interval_ms or as soon as batch_size points are buffered.
+    When the buffer is full the oldest points are dropped and counted in `dropped`,
+    points with NaN or infinite values are not buffered and counted in `rejected`.
+    Blocking write_points runs in the default executor, one batch at a time
+    """
+    def __init__(self,
+                 client: Optional[InfluxDBClient] = None,
+                 database: str = CONFIG.tsdb_database,
+                 batch_size: int = CONFIG.telemetry_batch_size,
+                 flush_interval_ms: int = CONFIG.telemetry_flush_ms,
+                 max_buffer: int = CONFIG.telemetry_buffer_size):
+        if client is None:
+            from db.tsdb.actions import client
+        self.client = client
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._buffer: Deque[str] = deque(maxlen=max_buffer)
+        self._pending: List[str] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+        self.dropped_batches = 0
+
+    def append(self,
+               measurement: str,
+               tags: Dict[str, Any],
+               fields: Dict[str, Any],
+               timestamp_ms: Optional[int] = None) -> None:
+        try:
+            line = to_line(measurement, tags, fields, timestamp_ms)
+        except ValueError:
+            self.rejected += 1
+            logger.warning(f'Rejected {measurement} point {fields}')
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(line)
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._buffer) + len(self._pending)
+
+    async def flush(self) -> None:
+        """
+        Write buffered points in batches. A failed batch is kept and retried on the next flush,
+        new points keep going to the ring buffer meanwhile.
+        A batch rejected by InfluxDB itself (4xx other than 429) would fail forever, it is dropped and counted
+        in `dropped_batches`
+        """
+        loop = asyncio.get_running_loop()
+        while self._pending or self._buffer:
+            if not self._pending:
+                count = min(self.batch_size, len(self._buffer))
+                self._pending = [self._buffer.popleft() for _ in range(count)]
+            try:
+                await loop.run_in_executor(None, partial(self.client.write_points,
+                                                         self._pending,
+                                                         database=self.database,
+                                                         time_precision='ms',
+                                                         protocol='line'))
+            except InfluxDBClientError as e:
+                if e.code == 429:
+                    self.failed_flushes += 1
+                    logger.warning(f'InfluxDB is rate limiting, {len(self._pending)} points are kept')
+                    return
+                self.dropped_batches += 1
+                logger.exception(f'InfluxDB rejected {len(self._pending)} points, dropping them')
+                self._pending = []
+                continue
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception(f'Failed to write {len(self._pending)} points to InfluxDB')
+                return
+            self.written += len(self._pending)
+            self._pending = []
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> asyncio.Task:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and flush what is left
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
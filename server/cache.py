@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aioredis
+
+from config import CONFIG
+from server.metrics import metrics
+from server.states import sync_board
+
+
+logger = logging.getLogger(__name__)
+
+
+class StateCache:
+    """
+    Read-through in-process cache of the board hashes.
+    Entries are dropped on a message in CONFIG.states_channel (published by process() of any worker),
+    ttl is a safety net for lost messages and for readings written by other workers
+    """
+    def __init__(self,
+                 redis: aioredis.Redis,
+                 channel: str = CONFIG.states_channel,
+                 ttl: float = CONFIG.state_cache_ttl):
+        self.redis = redis
+        self.channel = channel
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        # Bumped by invalidate(), a read started before it must not be stored
+        self._generations: Dict[str, int] = {}
+        self._generation = 0
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    def on_change(self, callback: Callable[[Optional[str]], None]) -> None:
+        """
+        callback(board) is called when states of the board were changed by any worker, board is None for all boards
+        """
+        self._listeners.append(callback)
+
+    def _fresh(self, board: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(board)
+        if entry is None or monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    async def sync(self, board: str, readings: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+        """
+        Get states of the board, writing readings from it if given.
+        Reads hit redis only on a cache miss
+        """
+        states = self._fresh(board)
+        if states is None:
+            metrics.inc('state_cache_total', result='miss')
+            generation = self._generations.get(board, 0), self._generation
+            states = await sync_board(self.redis, board, readings)
+            if generation == (self._generations.get(board, 0), self._generation):
+                self._entries[board] = (monotonic(), states)
+            return states
+        metrics.inc('state_cache_total', result='hit')
+        if readings:
+            metrics.inc('redis_calls_total', op='write_readings')
+            with metrics.timer('redis', 'write_readings'):
+                await self.redis.hset(board, mapping=readings)
+            states.update({field: str(value) for field, value in readings.items()})
+        return states
+
+    def invalidate(self, board: Optional[str] = None) -> None:
+        if board is None:
+            self._entries.clear()
+            self._generation += 1
+        else:
+            self._entries.pop(board, None)
+            self._generations[board] = self._generations.get(board, 0) + 1
+        for callback in self._listeners:
+            callback(board)
+
+    async def publish(self, board: str) -> None:
+        """
+        Notify all the workers that states of the board were changed
+        """
+        self.invalidate(board)
+        metrics.inc('redis_calls_total', op='publish')
+        await self.redis.publish(self.channel, board)
+
+    async def listen(self) -> None:
+        """
+        Background task, drops entries on messages from other workers
+        """
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Messages could be lost while (re)connecting
+                self.invalidate()
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.invalidate(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('State cache subscription failed, reconnecting')
+                self.invalidate()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
@@ -0,0 +1,44 @@
+from itertools import product
+from math import ceil, prod
+from typing import Dict, Iterator, List
+
+
+def grid_points(lower: float, upper: float, step: float) -> int:
+    """
+    Number of grid points of a parameter: lower, lower + step, ... up to upper
+    """
+    return int((upper - lower) / step + 1e-9) + 1
+
+
+def split_limits(limits: Dict[str, List[float]],
+                 step: float,
+                 chunks: int,
+                 max_points: int) -> Iterator[Dict[str, List[float]]]:
+    """
+    Split the grid into parts of at most max_points grid points, and at least `chunks` parts if the grid allows,
+    so every process of the pool gets work.
+    Parameters with the fewest points are kept whole in every part, the next one is cut into slices,
+    the ones with the most points are split into single points
+    """
+    params = sorted(limits, key=lambda p: grid_points(*limits[p], step))
+    counts = [grid_points(*limits[param], step) for param in params]
+    size = max(min(max_points, ceil(prod(counts) / chunks)), 1)
+    whole, inner = 0, 1
+    while whole < len(params) and inner * counts[whole] <= size:
+        inner *= counts[whole]
+        whole += 1
+    if whole == len(params):
+        yield dict(limits)
+        return
+    sliced, outer = params[whole], params[whole + 1:]
+    per_slice = size // inner
+    lower = limits[sliced][0]
+    for indices in product(*(range(count) for count in counts[whole + 1:])):
+        for first in range(0, counts[whole], per_slice):
+            part = dict(limits)
+            last = min(first + per_slice, counts[whole]) - 1
+            part[sliced] = [lower + first * step, lower + last * step]
+            for param, index in zip(outer, indices):
+                point = limits[param][0] + index * step
+                part[param] = [point, point]
+            yield part
@@ -0,0 +1,107 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+
+
+# Fields of the request payloads and deformat_lanit options they are decoded with
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    'Параметры': {},
+    'Входные параметры': {},
+    'Фации': {},
+    'Состояние': {},
+    'Метод расчета': {},
+    'Поиск в радиусе': {'add_if_empty': True},
+    'Опции оптимизации': {},
+    'Границы параметров': {},
+    'Целевая скважина': {'add_if_empty': True},
+}
+
+
+class LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.items: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.items.clear()
+
+
+class FieldCodec:
+    """
+    deformat_lanit bound to one payload field with its options.
+    Decoded values are memoized by the raw field bytes, callers get their own copy
+    """
+    def __init__(self, deformat: Callable, options: Dict[str, Any], cache_size: int):
+        self.deformat = deformat
+        self.options = options
+        self.cache = LRU(cache_size)
+
+    def __call__(self, value: Any) -> Any:
+        try:
+            key = orjson.dumps(value)
+        except TypeError:
+            return self.deformat(value, **self.options)
+        decoded = self.cache.get(key)
+        if decoded is None:
+            decoded = self.deformat(value, **self.options)
+            self.cache.put(key, decoded)
+        return copy.deepcopy(decoded)
+
+
+class LanitCodec:
+    """
+    Codecs of every known request field and formatted well lists by (field, dataset version).
+    Bump the dataset version when the wells change, formatted lists of the old version are never served again
+    """
+    def __init__(self,
+                 deformat: Callable,
+                 format: Callable,
+                 cache_size: int = 1024,
+                 wells_cache_size: int = 16):
+        self.format = format
+        self.fields = {field: FieldCodec(deformat, options, cache_size) for field, options in SCHEMAS.items()}
+        self.wells = LRU(wells_cache_size)
+        self.dataset_version = 0
+
+    def decode(self, kwargs: Dict[str, Any], field: str) -> Any:
+        return self.fields[field](kwargs[field])
+
+    def formatted_wells(self, field: str, load: Callable[[str], Any]) -> Any:
+        """
+        format_lanit(load(field)), cached. Shared between requests, must not be modified
+        """
+        key: Tuple[str, int] = (field, self.dataset_version)
+        formatted = self.wells.get(key)
+        if formatted is None:
+            formatted = self.format(load(field))
+            self.wells.put(key, formatted)
+        return formatted
+
+    def bump_dataset_version(self) -> int:
+        self.dataset_version += 1
+        self.wells.clear()
+        return self.dataset_version
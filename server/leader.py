@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+import socket
+from time import monotonic
+from typing import Awaitable, Callable, List
+from uuid import uuid4
+
+import aioredis
+
+from config import CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    Redis lease electing one worker among all the processes to run background jobs.
+    The lease is taken with SET NX PX and renewed every ttl / 3 while the owner is alive,
+    if the owner dies another worker takes it over after ttl.
+    A failed check keeps leadership until the lease could have expired, a lease key holding our own id is ours
+    """
+    def __init__(self,
+                 redis: aioredis.Redis,
+                 key: str = CONFIG.leader_key,
+                 ttl_ms: int = CONFIG.leader_ttl_ms):
+        self.redis = redis
+        self.key = key
+        self.ttl_ms = ttl_ms
+        self.id = f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+        self.is_leader = False
+        # monotonic() time the lease expires at, at the latest, as of the last successful check
+        self._expires = 0.0
+        self._renew = redis.register_script(RENEW)
+        self._release = redis.register_script(RELEASE)
+        self._on_elected: List[Callable[[], Awaitable[None]]] = []
+        self._on_demoted: List[Callable[[], Awaitable[None]]] = []
+
+    def on_elected(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._on_elected.append(callback)
+
+    def on_demoted(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._on_demoted.append(callback)
+
+    async def _set_leader(self, is_leader: bool) -> None:
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        logger.info(f'Worker {self.id} {"is elected" if is_leader else "lost"} leadership')
+        for callback in self._on_elected if is_leader else self._on_demoted:
+            try:
+                await callback()
+            except Exception:
+                logger.exception('Leadership callback failed')
+
+    async def check(self) -> bool:
+        """
+        Renew the lease if owned, try to take it otherwise
+        """
+        started = monotonic()
+        try:
+            owned = bool(await self._renew(keys=[self.key], args=[self.id, self.ttl_ms]))
+            if not owned:
+                owned = bool(await self.redis.set(self.key, self.id, nx=True, px=self.ttl_ms))
+        except Exception:
+            logger.exception('Leader lease check failed')
+            # Nobody else can take the lease before it expires
+            owned = self.is_leader and monotonic() < self._expires
+        else:
+            if owned:
+                self._expires = started + self.ttl_ms / 1000
+        await self._set_leader(owned)
+        return owned
+
+    async def run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.ttl_ms / 3000)
+
+    async def release(self) -> None:
+        if self.is_leader:
+            await self._release(keys=[self.key], args=[self.id])
+            await self._set_leader(False)
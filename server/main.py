@@ -1,193 +1,507 @@
+import asyncio
+import hashlib
 import json
-from typing import List, Dict, Tuple
-from fastapi import FastAPI, Body, Request
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+import logging
+from datetime import datetime
+from functools import lru_cache
+from html import escape
+from string import Template
+from time import time
+from typing import List, Dict, Optional, Tuple
+from fastapi import FastAPI, Body, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import (JSONResponse, HTMLResponse, PlainTextResponse, RedirectResponse, Response,
+                               StreamingResponse)
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import RedirectResponse, FileResponse
 import uvicorn
-from datetime import datetime
 import aioredis
 from config import CONFIG
-
-
+from server.schedule import ScheduleBook, build_schedules, minute_of_day, next_transitions, poll_delay_ms
+from server.states import (BOARD_DEFAULTS, READING_FIELDS, USER_BOARDS, migrate_legacy_keys, seed_defaults, set_field,
+                           set_defaults)
+from server.cache import StateCache
+from server.triggers import TriggerEngine, TriggerStore
+from server.registry import ConfigRegistry, Registry
+from server.protocol import MSGPACK_TYPES, decode_request, encode_response
+from server.notify import BoardNotifier
+from server.stream import StateStream
+from server.metrics import MetricsMiddleware, metrics
+from server.leader import LeaderLease
+from db.tsdb.telemetry import TelemetryWriter
+from db.tsdb.rollups import setup_rollups
+from db.journal import StateJournal
+from db.sql import crud
+
+
+logger = logging.getLogger(__name__)
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 redis = aioredis.from_url(f'{CONFIG.redis_url}:{CONFIG.redis_port}', decode_responses=True)
+state_cache = StateCache(redis)
+telemetry = TelemetryWriter()
+background_tasks: List[asyncio.Task] = []
+registry = ConfigRegistry(redis)
+# Admin writes through db.sql.crud make every worker reload the configuration
+crud.on_commit(registry.publish)
+notifier = BoardNotifier()
+state_cache.on_change(notifier.notify)
+state_stream = StateStream(state_cache.sync)
+state_cache.on_change(state_stream.mark)
+schedule_book = ScheduleBook()
+# Background jobs which must run once among all the workers
+leader = LeaderLease(redis)
+leader_tasks: List[asyncio.Task] = []
+# Every state change from process(), triggers and defaults, to restore redis after its restart
+journal = StateJournal()
+
+
+async def apply_trigger(thing_id: int, value: int):
+    """
+    The override replaced by the trigger is kept in CONFIG.trigger_overrides_key as JSON (null if the thing had none)
+    to be put back on release. Only the first of overlapping triggers saves it
+    """
+    thing = registry.current.things[thing_id]
+    previous = await redis.hget(thing.board, thing.name)
+    await redis.hsetnx(CONFIG.trigger_overrides_key, thing_id, json.dumps(previous))
+    await redis.hset(thing.board, thing.name, value)
+    journal.record(thing.board, {thing.name: value}, 'trigger')
+    await state_cache.publish(thing.board)
+
+
+async def restore_trigger(thing_id: int, fallback: int):
+    """
+    Put back the override replaced by the trigger, or give the thing back to its schedule
+    """
+    thing = registry.current.things[thing_id]
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hget(CONFIG.trigger_overrides_key, thing_id)
+        pipe.hdel(CONFIG.trigger_overrides_key, thing_id)
+        saved, _ = await pipe.execute()
+    previous = None if saved is None else json.loads(saved)
+    if previous is None and thing.schedule_id in schedule_book.bitmaps:
+        await redis.hdel(thing.board, thing.name)
+    else:
+        previous = fallback if previous is None else previous
+        await redis.hset(thing.board, thing.name, previous)
+    journal.record(thing.board, {thing.name: previous}, 'trigger')
+    await state_cache.publish(thing.board)
+
+
+triggers = TriggerEngine(apply_trigger, restore_trigger, TriggerStore(redis))
+
+
+def on_registry_refresh(current: Registry):
+    schedule_book.compile_rows(current.schedules)
+    triggers.load(current.triggers)
+
+
+registry.on_refresh(on_registry_refresh)
 
 
 async def get_states():
     """
     Get initial data from DB with sensors' settings: board_name, sensor_name, pins, units, schedules
     Then get states from frontend
-    Store data in redis with
-    hmset_dict(
+    Store data in redis with one hash per board
+    hset(
         board_name,
-        {
-            sensor_name: {
-                pin: 0,
-                state: 1
-                }
-            }
+        mapping={
+            sensor_name: state,
+            ...
         }
     )
     """
-    await redis.set('led_temp', 0.0)
-    await redis.set('coco_led', 0)
+    await seed_defaults(redis)
 
 
-def create_schedule(work_hours: List[int],
-                    work_time: int,
-                    sleep_time: int,
-                    start_minute: int = 0) -> Dict[int, List[Tuple[float, float]]]:
+async def restore_states():
     """
-    Create schedule in format of
-        {
-            hour1: [(start_minute, finish_minute), (start2, finish2), ...]
-            hour2: [...]
-        }
-    The start minute of the schedule is being reset after the last working hour or after a break in work_hours list
-    """
-    work_hours = sorted(work_hours)
-    schedule = {}
-    for i, hour in enumerate(work_hours):
-        schedule[hour] = [(i, i + work_time - 1) for i in range(start_minute, 60, sleep_time + work_time)]
-        # Reset if the break >= 1 hour
-        if i != 0:
-            if hour - work_hours[i-1] > 1:
-                start_minute = 0
-        # Correct last interval if it ends after 59 min
-        last_fin_minute = schedule[hour][-1][1]
-        last_start_minute = schedule[hour][-1][0]
-        if last_fin_minute >= 60:
-            schedule[hour][-1] = (last_start_minute, 59)
-        # Calculate starting minute of the next hour
-        start_minute = last_start_minute + sleep_time + work_time - 60
-    return schedule
+    Write journaled fields back to redis after it lost its data, before defaults are seeded.
+    Redis still holding CONFIG.journal_restored_key has the latest states already, restoring them again would
+    overwrite records other workers have not flushed yet with older ones.
+    Journal holds overrides only, readings are never overwritten
+    """
+    if await redis.exists(CONFIG.journal_restored_key):
+        return
+    await journal.flush()
+    states = await asyncio.get_running_loop().run_in_executor(None, journal.load)
+    async with redis.pipeline(transaction=True) as pipe:
+        for board, fields in states.items():
+            pipe.hset(board, mapping=fields)
+        pipe.set(CONFIG.journal_restored_key, 1)
+        await pipe.execute()
+    for board in states:
+        await state_cache.publish(board)
+
+
+async def listen_readings():
+    """
+    Leader only: readings of trigger sensors forwarded by other workers as "thing_id:value"
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(CONFIG.readings_channel)
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    thing_id, value = message['data'].split(':', 1)
+                    await triggers.on_reading(int(thing_id), float(value))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Readings subscription failed, reconnecting')
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+
+async def migrate_states():
+    """
+    First start after the switch to board hashes: keep user overrides of the old top-level keys
+    """
+    moved = await migrate_legacy_keys(redis)
+    for board, fields in moved.items():
+        logger.info(f'Migrated {fields} into the {board} hash')
+        overrides = {field: value for field, value in fields.items() if field not in READING_FIELDS}
+        if overrides:
+            journal.record(board, overrides, 'migration')
+        await state_cache.publish(board)
+
+
+async def start_leader_jobs():
+    try:
+        await migrate_states()
+    except Exception:
+        logger.exception('Unable to migrate states from the top-level keys')
+    try:
+        await restore_states()
+    except Exception:
+        logger.exception('Unable to restore states from the journal')
+    await get_states()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, setup_rollups, telemetry.client)
+    except Exception:
+        logger.exception('Unable to set up InfluxDB rollups')
+    try:
+        await triggers.resume()
+    except Exception:
+        logger.exception('Unable to resume active triggers')
+    leader_tasks.append(asyncio.create_task(triggers.timers.run()))
+    leader_tasks.append(asyncio.create_task(listen_readings()))
+    leader_tasks.append(asyncio.create_task(journal.run_compaction()))
+
+
+async def stop_leader_jobs():
+    for task in leader_tasks:
+        task.cancel()
+    await asyncio.gather(*leader_tasks, return_exceptions=True)
+    leader_tasks.clear()
+    triggers.reset()
+
+
+leader.on_elected(start_leader_jobs)
+leader.on_demoted(stop_leader_jobs)
+
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await registry.refresh()
+    except Exception:
+        logger.exception('Unable to load boards configuration')
+    background_tasks.append(asyncio.create_task(state_cache.listen()))
+    background_tasks.append(asyncio.create_task(registry.listen()))
+    background_tasks.append(asyncio.create_task(state_stream.run()))
+    await leader.check()
+    background_tasks.append(asyncio.create_task(leader.run()))
+    # Every worker flushes readings it has received itself
+    telemetry.start()
+    journal.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await leader.release()
+    await telemetry.stop()
+    await journal.stop()
 
 
 work_time = 5
 sleep_time = 5
-schedule = create_schedule(work_hours=[i for i in range(8, 24)] + [0],
-                           work_time=work_time,
-                           sleep_time=sleep_time)
-schedule_all_day = create_schedule(work_hours=[i for i in range(24)],
-                                   work_time=work_time,
-                                   sleep_time=sleep_time)
-test_schedule = create_schedule(work_hours=[i for i in range(3, 8)],
-                                work_time=30,
-                                sleep_time=2)
+# Day bitmaps used by /interact, state is a single index by minute of the day
+farm_schedules = build_schedules([(work_time, sleep_time, [i for i in range(8, 24)] + [0]),
+                                  (work_time, sleep_time, [i for i in range(24)])])
+schedule_bitmaps = dict(zip(['normal', 'neglect_hours'], map(bytearray, farm_schedules)))
+schedule_transitions = dict(zip(['normal', 'neglect_hours'], next_transitions(farm_schedules)))
+# Values of farm's custom field
+FARM_MODES = frozenset(schedule_bitmaps) | {'forcibly_off'}
+
+
+def farm_led(custom: str) -> Optional[int]:
+    """
+    LED state required by the farm mode now, None for an unknown mode
+    """
+    if custom == 'forcibly_off':
+        return 0
+    bitmap = schedule_bitmaps.get(custom)
+    return None if bitmap is None else bitmap[minute_of_day()]
+
+
+with open("./templates/dashboard.html") as f:
+    dashboard_template = Template(f.read())
+
+
+@lru_cache(maxsize=64)
+def render_dashboard(led_state: int, custom: str, led_temp: str) -> Tuple[bytes, str]:
+    """
+    Rendered page and its ETag, the page only depends on these values
+    """
+    html_content = dashboard_template.substitute(
+        led_state='ON' if led_state else 'OFF',
+        neglect_hours='disabled' if custom == 'neglect_hours' else '',
+        forcibly_off='disabled' if custom == 'forcibly_off' else '',
+        normal='disabled' if custom == 'normal' else '',
+        led_temp=escape(led_temp),
+    ).encode()
+    return html_content, f'"{hashlib.md5(html_content).hexdigest()}"'
 
 
 @app.get("/")
-async def read_root():
-    with open("./db/states.json") as f:
-        states = json.loads(f.read())
+async def read_root(request: Request):
+    custom = (await state_cache.sync('farm'))['custom']
+    led_state = farm_led(custom)
+    if led_state is None:
+        # Still render the page, it is where the mode is fixed from
+        logger.warning(f'Unknown custom parameter {custom}')
+        led_state = 0
+    led_temp = (await state_cache.sync('coco'))['led_temp']
+    with metrics.timer('read_root', 'render'):
+        html_content, etag = render_dashboard(led_state, custom, led_temp)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=html_content, status_code=200, headers=headers)
+
+
+def append_reading(measurement: str, board: str, value) -> None:
+    """
+    Numeric readings go to InfluxDB, anything else the board sends is only kept in redis
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        logger.warning(f'Non-numeric {measurement} reading {value!r} from {board}')
+        return
+    telemetry.append(measurement, {'board': board}, {'value': value})
 
-    with open("./db/custom.json") as f:
-        custom = json.loads(f.read())
-        custom = custom['custom']
 
-    neglect_hours = forcibly_off = normal = ''
-    if custom == 'neglect_hours':
-        neglect_hours = 'disabled'
-    if custom == 'forcibly_off':
-        forcibly_off = 'disabled'
-    if custom == 'normal':
-        normal = 'disabled'
-
-    led_temp = await redis.get('led_temp')
-    html_content = f"""
-        <script>
-        submitForms = function(){{
-            var formData = JSON.stringify($("#form1").serializeArray());
-            $.ajax({{
-              type: "POST",
-              url: "/led",
-              data: formData,
-              success: function(){{}},
-              dataType: "json",
-              contentType : "application/json"
-            }});
-        }}
-        </script>
-        <br>
-        <h3>Current LED state: {'ON' if states["LED"] else 'OFF'}</h3>
-        <br>
-        <iframe name="states" style="display:none;"></iframe>
-        <form name="form1" action="/process" method="post" target="states">
-            <input type="submit" name="ledstate" value=1 />ON
-            <input type="submit" name="ledstate" value=0 />OFF
-            <br>
-            <input type="submit" name="custom" value="neglect_hours" {neglect_hours}" />
-            <input type="submit" name="custom" value="forcibly_off" {forcibly_off}" />
-            <input type="submit" name="custom" value="normal" {normal}" />
-        </form>
-
-        <h1> {led_temp} </h1>
-        <iframe name="coco" style="display:none;"></iframe>
-        <form name="form2" action="/process" method="post" target="coco">
-            <input type="submit" name="coco_led" value=1 />ON
-            <input type="submit" name="coco_led" value=0 />OFF
-        </form>
-        
-    """
-    return HTMLResponse(content=html_content, status_code=200)
+async def decide(name: str, data: Dict) -> Optional[Dict[str, int]]:
+    """
+    Handle readings from the board and get its required states.
+    None for unknown board
+    """
+    thing_ids = registry.current.thing_ids
+    for sensor, value in data.items():
+        thing_id = thing_ids.get((name, sensor))
+        if thing_id is not None and triggers.watches(thing_id):
+            # Triggers and their timers live in the leader worker only
+            if leader.is_leader:
+                await triggers.on_reading(thing_id, value)
+            else:
+                await redis.publish(CONFIG.readings_channel, f'{thing_id}:{value}')
+
+    # Write existing states from arduino
+    if name == 'farm':
+        states = {}
+
+        board_states = await state_cache.sync(name)
+        custom = board_states['custom']
+        states['LED'] = farm_led(custom)
+        if states['LED'] is None:
+            raise AttributeError(f'Unknown custom parameter {custom}')
+        return states
+
+    elif name == 'coco':
+        readings = None
+        if data.get('led_temp') is not None:
+            append_reading('led_temp', name, data['led_temp'])
+            readings = {'led_temp': data['led_temp']}
+        board_states = await state_cache.sync(name, readings)
+        return {"coco_led": int(board_states['coco_led'])}
+
+    board = registry.current.boards.get(name)
+    if board is None:
+        return None
+    board_states = await state_cache.sync(name)
+    minute = minute_of_day()
+    states = {}
+    for thing in board.things:
+        if thing.name in data and not thing.is_writable:
+            append_reading(thing.tsdb_tag or thing.name, name, data[thing.name])
+        elif thing.is_writable:
+            # User or trigger defined state overrides the schedule
+            if thing.name in board_states:
+                states[thing.name] = int(board_states[thing.name])
+            elif thing.schedule_id in schedule_book.bitmaps:
+                states[thing.name] = schedule_book.bitmaps[thing.schedule_id][minute]
+    return states
+
+
+async def next_poll_ms(name: str, now: Optional[datetime] = None) -> int:
+    """
+    Poll interval hint for the board: until the next schedule transition.
+    Capped by CONFIG.max_poll_ms, since user overrides from /process could come at any time.
+    Boards with sensors used by triggers or things set by triggers, and boards with fields changed from /process
+    keep polling every CONFIG.poll_interval_ms at most.
+    Trigger timers live in the leader only, so they are not used here: the hint must not depend on the worker
+    """
+    board = registry.current.boards.get(name)
+    if board is not None and any(triggers.watches(thing.id) or triggers.targets(thing.id) for thing in board.things):
+        return CONFIG.poll_interval_ms
+
+    now = now or datetime.now()
+    seconds_of_day = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    board_states = await state_cache.sync(name)
+    rows = []
+    if name == 'farm' and board_states['custom'] in schedule_transitions:
+        rows.append(schedule_transitions[board_states['custom']])
+    for thing in board.things if board is not None else ():
+        if thing.is_writable and thing.name not in board_states and thing.schedule_id in schedule_book.transitions:
+            rows.append(schedule_book.transitions[thing.schedule_id])
+
+    delay = CONFIG.poll_interval_ms if name in USER_BOARDS else CONFIG.max_poll_ms
+    for row in rows:
+        delay = min(delay, poll_delay_ms(row, seconds_of_day, CONFIG.max_poll_ms, CONFIG.poll_slack_ms))
+    return max(delay, CONFIG.min_poll_ms)
 
 
 @app.post("/interact")
 async def interact(request: Request):
-        # name: str = Body(...),
-        #           LED: int = Body(...)):
     """
     Read data from arduino
     Send back required states
+    JSON by default, msgpack if the request has Content-Type: application/msgpack (see server/protocol.py)
     """
-    data = await request.json()
-    name = data['name']
+    use_msgpack = request.headers.get('content-type', '').startswith(MSGPACK_TYPES)
+    body = await request.body()
+    with metrics.timer('interact', 'parse'):
+        if use_msgpack:
+            name, data = decode_request(body, registry.current)
+        else:
+            data = json.loads(body)
+            name = data['name']
 
-    # Write existing states from arduino
-    if name == 'farm':
-        # LED = data['LED']
-        # with open("./db/states.json", "w") as f:
-        #     f.write(json.dumps({"name": name, "LED": LED}))
+    with metrics.timer('interact', 'decide'):
+        states = await decide(name, data)
+    if states is None:
+        return JSONResponse({'error': f'Unknown board {name}'}, status_code=404)
+    metrics.seen(name)
+    state_stream.mark(name)
+    with metrics.timer('interact', 'next_poll'):
+        states['next_poll_ms'] = await next_poll_ms(name)
 
-        # Get required states
-        # with open("./db/required.json") as f:
-        #     states = json.loads(f.read())
+    if use_msgpack:
+        return Response(encode_response(name, states, registry.current), media_type=MSGPACK_TYPES[0])
+    return JSONResponse(states)
 
-        # Get user defined state
-        # with open("./db/custom.json") as f:
-        #     custom = json.loads(f.read())
-        #     custom = custom['custom']
 
-        states = {}
+def seconds_to_next_minute() -> float:
+    # Schedules have minute resolution, required states could change only on a minute boundary
+    return 60 - time() % 60
 
-        if not await redis.exists('custom'):
-            await set_default_redis('custom')
-        custom = await redis.get('custom')
-        current_hour = datetime.now().hour
-
-        current_minute = datetime.now().minute
-        if custom != 'forcibly_off':
-            if custom == 'neglect_hours':
-                hourly_schedule = schedule_all_day[current_hour]
-            elif custom == 'normal':
-                hourly_schedule = schedule[current_hour]
-            else:
-                raise AttributeError(f'Unknown custom parameter {custom}')
-            if any(interval[0] <= current_minute <= interval[1] for interval in hourly_schedule):
-                states['LED'] = 1
-            else:
-                states['LED'] = 0
-        else:
-            states['LED'] = 0
-        return JSONResponse(states)
 
-    elif name == 'coco':
-        await redis.set('led_temp', data['led_temp'])
-        if not await redis.exists('coco_led'):
-            await set_default_redis('coco_led')
-        coco_led_state = await redis.get('coco_led')
-        return JSONResponse({"coco_led": int(coco_led_state)})
+def differs(states: Dict, data: Dict) -> bool:
+    return any(str(data.get(name)) != str(value) for name, value in states.items())
+
+
+@app.post("/interact/wait")
+async def interact_wait(request: Request, timeout: float = CONFIG.long_poll_timeout):
+    """
+    Long-poll variant of /interact: the board sends its current states along with readings,
+    the request is parked until required states differ from them or timeout expires
+    """
+    data = await request.json()
+    name = data['name']
+    with metrics.timer('interact_wait', 'decide'):
+        states = await decide(name, data)
+    if states is None:
+        return JSONResponse({'error': f'Unknown board {name}'}, status_code=404)
+    metrics.seen(name)
+    state_stream.mark(name)
+
+    deadline = time() + min(timeout, CONFIG.long_poll_timeout)
+    # Readings were handled already, later decisions only check required states
+    reported = {key: value for key, value in data.items() if key in states}
+    while not differs(states, reported):
+        remaining = deadline - time()
+        if remaining <= 0:
+            break
+        await notifier.wait(name, min(remaining, seconds_to_next_minute()))
+        states = await decide(name, {})
+    return JSONResponse(states)
+
+
+@app.websocket("/ws/{name}")
+async def interact_ws(websocket: WebSocket, name: str):
+    """
+    Push variant of /interact: the board sends readings as JSON messages whenever it wants,
+    required states are sent after every message and on every change
+    """
+    if name not in BOARD_DEFAULTS and name not in registry.current.boards:
+        # Before any waiting, so unknown names don't park on the notifier
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    metrics.seen(name)
+    sent = None
+    receive = asyncio.create_task(websocket.receive_json())
+    try:
+        while True:
+            wait = asyncio.create_task(notifier.wait(name, seconds_to_next_minute()))
+            done, _ = await asyncio.wait({receive, wait}, return_when=asyncio.FIRST_COMPLETED)
+            wait.cancel()
+            data = {}
+            if receive in done:
+                data = receive.result()
+                receive = asyncio.create_task(websocket.receive_json())
+            with metrics.timer('interact_ws', 'decide'):
+                states = await decide(name, data)
+            if states is None:
+                await websocket.close(code=1008)
+                return
+            if data:
+                metrics.seen(name)
+                state_stream.mark(name)
+            if data or states != sent:
+                await websocket.send_json(states)
+                sent = states
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receive.cancel()
+
+
+@app.get("/stream")
+async def stream():
+    """
+    Server-Sent Events with board states for the frontend:
+    `snapshot` event with {board: {field: value}}, then messages with changed fields only
+    """
+    boards = set(BOARD_DEFAULTS) | set(registry.current.boards)
+    return StreamingResponse(state_stream.subscribe(boards),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
 
 
 @app.post("/process")
@@ -196,29 +510,30 @@ async def process(payload: str = Body(...)):
     Change state in DB
     """
     payload = payload.split("=")
-    if payload[0] == 'ledstate':
-        await redis.set('ledstate', int(payload[1]))
-        # with open("./db/required.json", 'w') as f:
-        #     f.write(json.dumps({"LED": int(payload[1])}))
-    elif payload[0] == 'custom':
-        await redis.set('custom', payload[1])
-        # with open("./db/custom.json", 'w') as f:
-        #     f.write(json.dumps({"custom": payload[1]}))
-    elif payload[0] == 'coco_led':
-        await redis.set('coco_led', int(payload[1]))
+    field, value = payload[0], None
+    if field in ('ledstate', 'coco_led'):
+        value = int(payload[1])
+    elif field == 'custom':
+        if payload[1] in FARM_MODES:
+            value = payload[1]
+        else:
+            logger.warning(f'Unknown custom parameter {payload[1]}')
+    if value is not None:
+        board = await set_field(redis, field, value)
+        journal.record(board, {field: value}, 'process')
+        await state_cache.publish(board)
     return RedirectResponse("/", status_code=302)
 
 
 async def set_default_redis(key: str = None):
-    if key:
-        if key == 'custom':
-            await redis.set('custom', 'forcibly_off')
-        else:
-            await redis.set(key, 1)
-    else:
-        await redis.set('coco_led', 1)
-        await redis.set('custom', 'forcibly_off')
-        await redis.set('ledstate', 1)
+    await set_defaults(redis, key)
+    for board, defaults in BOARD_DEFAULTS.items():
+        fields = defaults if key is None else {field: value for field, value in defaults.items() if field == key}
+        if fields:
+            journal.record(board, fields, 'defaults')
+    state_cache.invalidate()
+    for board in BOARD_DEFAULTS:
+        await redis.publish(CONFIG.states_channel, board)
 
 
 # app.mount("", StaticFiles(directory="sveltekit/public/", html=True), name="static")
@@ -230,4 +545,4 @@ async def set_default_redis(key: str = None):
 
 
 if __name__ == '__main__':
-    uvicorn.run(app, port=8000, host="0.0.0.0")
+    uvicorn.run("server.main:app", port=8000, host="0.0.0.0", workers=CONFIG.workers)
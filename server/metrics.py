@@ -0,0 +1,134 @@
+import os
+import socket
+from bisect import bisect_left
+from time import perf_counter, time
+from typing import Dict, List, Optional, Tuple
+
+
+# Seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.started)
+
+
+class Metrics:
+    """
+    In-process latency histograms per (handler, stage), counters and last seen time of the boards,
+    rendered in Prometheus text format.
+    Every uvicorn worker has its own, /metrics answers with the one of the worker the scrape reached.
+    All the series are labelled with the worker (host:pid by default) to tell them apart
+    """
+    def __init__(self, prefix: str = 'homefarm', worker: Optional[str] = None):
+        self.prefix = prefix
+        self.worker = worker
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+        self.last_seen: Dict[str, float] = {}
+
+    def histogram(self, handler: str, stage: str) -> Histogram:
+        histogram = self.histograms.get((handler, stage))
+        if histogram is None:
+            histogram = self.histograms[(handler, stage)] = Histogram()
+        return histogram
+
+    def timer(self, handler: str, stage: str) -> Timer:
+        return Timer(self.histogram(handler, stage))
+
+    def inc(self, name: str, value: int = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def seen(self, board: str) -> None:
+        self.last_seen[board] = time()
+
+    def render(self, active_window_sec: float = 300) -> str:
+        p = self.prefix
+        # Looked up here, workers are forked after import
+        worker = f'worker="{self.worker or f"{socket.gethostname()}:{os.getpid()}"}"'
+        lines = [f'# TYPE {p}_handler_seconds histogram']
+        for (handler, stage), histogram in sorted(self.histograms.items()):
+            labels = f'{worker},handler="{handler}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{p}_handler_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{p}_handler_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{p}_handler_seconds_count{{{labels}}} {histogram.count}')
+
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f'# TYPE {p}_{name} counter')
+            for (counter, labels), value in sorted(self.counters.items()):
+                if counter == name:
+                    label_text = ','.join([worker] + [f'{key}="{val}"' for key, val in labels])
+                    lines.append(f'{p}_{name}{{{label_text}}} {value}')
+
+        now = time()
+        lines.append(f'# TYPE {p}_board_last_seen_seconds gauge')
+        for board, seen in sorted(self.last_seen.items()):
+            lines.append(f'{p}_board_last_seen_seconds{{{worker},board="{board}"}} {seen}')
+        lines.append(f'# TYPE {p}_active_boards gauge')
+        lines.append(f'{p}_active_boards{{{worker}}} {sum(1 for seen in self.last_seen.values() if now - seen < active_window_sec)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: total latency of every http request by handler (endpoint function name)
+    and count of 5xx responses and unhandled exceptions
+    """
+    def __init__(self, app, collector: Metrics = metrics):
+        self.app = app
+        self.metrics = collector
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Router puts matched endpoint into the scope
+            endpoint = scope.get('endpoint')
+            handler = getattr(endpoint, '__name__', 'unmatched')
+            self.metrics.histogram(handler, 'total').observe(perf_counter() - started)
+            if status >= 500:
+                self.metrics.inc('errors_total', handler=handler)
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Dict, Optional
+
+
+class BoardNotifier:
+    """
+    Wakes requests parked on a board when its states change.
+    One event per board with waiters, replaced on every change, so a parked request costs a future.
+    The event is dropped when its last waiter leaves
+    """
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def notify(self, board: Optional[str] = None) -> None:
+        boards = list(self._events) if board is None else [board]
+        for name in boards:
+            event = self._events.pop(name, None)
+            self._waiters.pop(name, None)
+            if event is not None:
+                event.set()
+
+    async def wait(self, board: str, timeout: float) -> bool:
+        """
+        True if the board was changed before timeout
+        """
+        event = self._events.get(board)
+        if event is None:
+            event = self._events[board] = asyncio.Event()
+        self._waiters[board] = self._waiters.get(board, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            # Not notified: timed out or cancelled
+            if self._events.get(board) is event:
+                self._waiters[board] -= 1
+                if not self._waiters[board]:
+                    del self._events[board], self._waiters[board]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._events)
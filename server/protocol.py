@@ -0,0 +1,47 @@
+"""
+Compact msgpack variant of the /interact protocol.
+Request:  [board_name, pin_mask, {sensor: value, ...}]
+Response: [pin_mask, {name: value, ...}]
+Bit N of pin_mask is the state of the writable thing on pin N of the board (from the registry),
+states of things without a known pin go to the map
+"""
+from typing import Any, Dict, Tuple
+
+import msgpack
+
+from server.registry import Registry
+
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def _pins(board_name: str, registry: Registry) -> Dict[str, int]:
+    board = registry.boards.get(board_name)
+    if board is None:
+        return {}
+    return {thing.name: thing.pin for thing in board.things if thing.is_writable and thing.pin is not None}
+
+
+def decode_request(body: bytes, registry: Registry) -> Tuple[str, Dict[str, Any]]:
+    """
+    Returns board name and data in the same format as the JSON request
+    """
+    name, pin_mask, values = msgpack.unpackb(body, raw=False)
+    data = dict(values or {})
+    for thing_name, pin in _pins(name, registry).items():
+        data.setdefault(thing_name, (pin_mask >> pin) & 1)
+    data['name'] = name
+    return name, data
+
+
+def encode_response(board_name: str, states: Dict[str, Any], registry: Registry) -> bytes:
+    pins = _pins(board_name, registry)
+    pin_mask = 0
+    values: Dict[str, Any] = {}
+    for name, value in states.items():
+        pin = pins.get(name)
+        if pin is not None and value in (0, 1):
+            pin_mask |= value << pin
+        else:
+            values[name] = value
+    return msgpack.packb([pin_mask, values])
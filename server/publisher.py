@@ -0,0 +1,115 @@
+import logging
+import queue
+import threading
+from time import sleep
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+
+
+logger = logging.getLogger(__name__)
+
+
+class Publisher:
+    """
+    Outbound queue between the request handlers and the broker.
+    Payloads are encoded and sent from one thread in batches of up to batch_size,
+    every send is retried with exponential backoff. When the queue is full the oldest payload is dropped
+    """
+    def __init__(self,
+                 send: Callable[[str], Any],
+                 max_queue: int = 10_000,
+                 batch_size: int = 100,
+                 retries: int = 5,
+                 backoff_ms: int = 100):
+        self.send = send
+        self.queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.dropped = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, payload: Dict[str, Any]) -> None:
+        while True:
+            try:
+                self.queue.put_nowait(payload)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _batch(self, timeout: float) -> List[Dict[str, Any]]:
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _encode(self, payload: Dict[str, Any]) -> Optional[str]:
+        """
+        JSON message of the payload. A payload which can't be encoded is replaced by an error for the client,
+        None if even that fails
+        """
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        except TypeError as e:
+            logger.exception(f'Unable to encode result of {payload.get("id")}')
+            try:
+                error = {'id': payload.get('id'), 'error': f'Unable to encode the result: {e}'}
+                return orjson.dumps(error).decode('utf-8')
+            except TypeError:
+                return None
+
+    def _send(self, payload: Dict[str, Any]) -> None:
+        message = self._encode(payload)
+        if message is None:
+            self.failed += 1
+            return
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(message)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    self.failed += 1
+                    logger.exception(f'Failed to publish result of {payload.get("id")}')
+                    return
+                sleep(self.backoff_ms * 2 ** attempt / 1000)
+
+    def flush(self, timeout: float = 0) -> int:
+        """
+        Send one batch. Returns its size
+        """
+        batch = self._batch(timeout)
+        for payload in batch:
+            self._send(payload)
+        return len(batch)
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self.flush(timeout=0.5)
+        # Send what was queued before stop()
+        while self.flush():
+            pass
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name='publisher')
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Tuple
+
+import aioredis
+
+from config import CONFIG
+from db.sql.database import AsyncSessionLocal
+from db.sql import crud
+from server.triggers import Trigger
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThingConfig:
+    __slots__ = ('id', 'board', 'name', 'pin', 'analog', 'is_writable', 'tsdb_tag', 'schedule_id')
+
+    def __init__(self, id, board, name, pin, analog, is_writable, tsdb_tag, schedule_id):
+        self.id = id
+        self.board = board
+        self.name = name
+        self.pin = pin
+        self.analog = analog
+        self.is_writable = is_writable
+        self.tsdb_tag = tsdb_tag
+        self.schedule_id = schedule_id
+
+
+class BoardConfig:
+    __slots__ = ('id', 'name', 'description', 'things')
+
+    def __init__(self, id, name, description, things: Tuple[ThingConfig, ...]):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.things = things
+
+
+class ScheduleConfig:
+    __slots__ = ('id', 'hour', 'list_of_tuple_minutes')
+
+    def __init__(self, id, hour, list_of_tuple_minutes):
+        self.id = id
+        self.hour = hour
+        self.list_of_tuple_minutes = list_of_tuple_minutes
+
+
+class Registry:
+    """
+    Immutable snapshot of boards, things, schedules and triggers.
+    Never modified in place, a refresh builds a new one
+    """
+    __slots__ = ('boards', 'things', 'thing_ids', 'schedules', 'triggers')
+
+    def __init__(self,
+                 boards: Dict[str, BoardConfig],
+                 schedules: Tuple[ScheduleConfig, ...] = (),
+                 triggers: Tuple[Trigger, ...] = ()):
+        things = {thing.id: thing for board in boards.values() for thing in board.things}
+        self.boards: Mapping[str, BoardConfig] = MappingProxyType(boards)
+        self.things: Mapping[int, ThingConfig] = MappingProxyType(things)
+        self.thing_ids: Mapping[Tuple[str, str], int] = MappingProxyType(
+            {(thing.board, thing.name): thing.id for thing in things.values()})
+        self.schedules = schedules
+        self.triggers = triggers
+
+
+async def load_registry() -> Registry:
+    """
+    Three queries on the async engine: boards with things, schedules, triggers
+    """
+    async with AsyncSessionLocal() as db:
+        boards = {}
+        for board in await crud.get_boards(db):
+            things = tuple(ThingConfig(thing.id, board.name, thing.equipment_name, thing.pin, thing.analog,
+                                       thing.is_writable, thing.tsdb_tag, thing.schedule_id)
+                           for thing in board.things)
+            boards[board.name] = BoardConfig(board.id, board.name, board.description, things)
+        schedules = tuple(ScheduleConfig(row.id, row.hour, row.list_of_tuple_minutes)
+                          for row in await crud.get_schedules(db))
+        triggers = tuple(Trigger.from_row(row) for row in await crud.get_triggers(db))
+    return Registry(boards, schedules, triggers)
+
+
+class ConfigRegistry:
+    """
+    Holder of the current Registry. Request handlers read `current` and never touch SQLAlchemy,
+    refresh() swaps the snapshot with a single assignment.
+    Admin writes through db.sql.crud publish to CONFIG.registry_channel (see crud.on_commit in server.main)
+    to make every worker refresh
+    """
+    def __init__(self, redis: aioredis.Redis, channel: str = CONFIG.registry_channel):
+        self.redis = redis
+        self.channel = channel
+        self.current = Registry({})
+        self._listeners: List[Callable[[Registry], None]] = []
+
+    def on_refresh(self, callback: Callable[[Registry], None]) -> None:
+        """
+        callback(registry) is called after every refresh
+        """
+        self._listeners.append(callback)
+
+    async def refresh(self) -> Registry:
+        registry = await load_registry()
+        self.current = registry
+        for callback in self._listeners:
+            callback(registry)
+        return registry
+
+    async def publish(self) -> None:
+        await self.redis.publish(self.channel, 'refresh')
+
+    async def listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Registry subscription failed, reconnecting')
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
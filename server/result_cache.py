@@ -0,0 +1,142 @@
+import heapq
+import logging
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class Entry:
+    __slots__ = ('size', 'expires', 'key', 'result')
+
+    def __init__(self, size: int, expires: float, key: Optional[str], result: Optional[Dict[str, Any]]):
+        self.size = size
+        self.expires = expires
+        self.key = key
+        self.result = result
+
+
+class ResultCache:
+    """
+    Index of the result files in the static directory: expiry heap, LRU order bounded by total size
+    and the result of every file by hash of the request inputs, so repeated requests reuse the file.
+    Files are deleted only by the sweep and by eviction, downloads don't touch the directory
+    """
+    def __init__(self, directory: str, lifetime_sec: float, max_bytes: int):
+        self.directory = directory
+        self.lifetime_sec = lifetime_sec
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[str, Entry]' = OrderedDict()
+        self.keys: Dict[str, str] = {}
+        self.size = 0
+        # (expires, filename), stale items are skipped when popped
+        self._expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._adopt()
+
+    def _adopt(self) -> None:
+        """
+        Files left from the previous run expire after lifetime from their mtime
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for item in sorted(os.scandir(self.directory), key=lambda item: item.stat().st_mtime):
+            if item.is_file() and not item.name.endswith('.part'):
+                stat = item.stat()
+                self._insert(item.name, stat.st_size, stat.st_mtime + self.lifetime_sec, None, None)
+        self._evict()
+
+    def _insert(self, filename: str, size: int, expires: float,
+                key: Optional[str], result: Optional[Dict[str, Any]]) -> None:
+        self._drop(filename, remove=False)
+        self.entries[filename] = Entry(size, expires, key, result)
+        self.size += size
+        if key is not None:
+            self.keys[key] = filename
+        heapq.heappush(self._expiry, (expires, filename))
+
+    def _drop(self, filename: str, remove: bool = True) -> None:
+        entry = self.entries.pop(filename, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        if entry.key is not None and self.keys.get(entry.key) == filename:
+            del self.keys[entry.key]
+        if remove:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self.entries:
+            filename = next(iter(self.entries))
+            logger.info(f'Evicting {filename} from the result cache')
+            self._drop(filename)
+
+    def add(self, filename: str, key: Optional[str] = None, result: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Register a file just written to the directory, with the result it belongs to
+        """
+        size = os.path.getsize(os.path.join(self.directory, filename))
+        with self._lock:
+            self._insert(filename, size, time() + self.lifetime_sec, key, result)
+            self._evict()
+
+    def touch(self, filename: str) -> bool:
+        """
+        Mark the file as recently used. False if it's not in the cache
+        """
+        with self._lock:
+            entry = self.entries.get(filename)
+            if entry is None or entry.expires <= time():
+                return False
+            self.entries.move_to_end(filename)
+            return True
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Result of the earlier request with the same inputs if its file is still cached
+        """
+        with self._lock:
+            filename = self.keys.get(key)
+            if filename is None:
+                return None
+            entry = self.entries[filename]
+            if entry.expires <= time():
+                return None
+            self.entries.move_to_end(filename)
+            return dict(entry.result)
+
+    def sweep(self) -> int:
+        """
+        Delete expired files. Returns their number
+        """
+        removed = 0
+        now = time()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires, filename = heapq.heappop(self._expiry)
+                entry = self.entries.get(filename)
+                if entry is not None and entry.expires == expires:
+                    self._drop(filename)
+                    removed += 1
+        return removed
+
+    def run(self, interval_sec: float) -> None:
+        while not self._stop.wait(interval_sec):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Result cache sweep failed')
+
+    def start(self, interval_sec: float) -> None:
+        self._stop.clear()
+        threading.Thread(target=self.run, args=(interval_sec,), daemon=True, name='result-cache-sweep').start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,212 @@
+import ast
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def create_schedule(work_hours: List[int],
+                    work_time: int,
+                    sleep_time: int,
+                    start_minute: int = 0) -> Dict[int, List[Tuple[float, float]]]:
+    """
+    Create schedule in format of
+        {
+            hour1: [(start_minute, finish_minute), (start2, finish2), ...]
+            hour2: [...]
+        }
+    The start minute of the schedule is being reset after the last working hour or after a break in work_hours list
+    """
+    work_hours = sorted(work_hours)
+    schedule = {}
+    for i, hour in enumerate(work_hours):
+        schedule[hour] = [(i, i + work_time - 1) for i in range(start_minute, 60, sleep_time + work_time)]
+        # Reset if the break >= 1 hour
+        if i != 0:
+            if hour - work_hours[i-1] > 1:
+                start_minute = 0
+        # Correct last interval if it ends after 59 min
+        last_fin_minute = schedule[hour][-1][1]
+        last_start_minute = schedule[hour][-1][0]
+        if last_fin_minute >= 60:
+            schedule[hour][-1] = (last_start_minute, 59)
+        # Calculate starting minute of the next hour
+        start_minute = last_start_minute + sleep_time + work_time - 60
+    return schedule
+
+
+def build_schedules(combinations: Sequence[Tuple[int, int, Sequence[int]]],
+                    start_minute: int = 0) -> np.ndarray:
+    """
+    Vectorized create_schedule() + compile_schedule() for many (work_time, sleep_time, work_hours) at once.
+    Returns uint8 array of shape (len(combinations), 1440), 1 - ON.
+    Same result as create_schedule(): working hours are taken in sorted order as if they were consecutive,
+    so the work/sleep period carries over the breaks, and an interval is cut at the end of its hour
+    """
+    n = len(combinations)
+    work = np.array([c[0] for c in combinations]).reshape(n, 1, 1)
+    period = work + np.array([c[1] for c in combinations]).reshape(n, 1, 1)
+    # Position of the hour among sorted working hours, -1 for idle hours
+    rank = np.full((n, 24), -1)
+    for i, (_, _, work_hours) in enumerate(combinations):
+        for position, hour in enumerate(sorted(work_hours)):
+            rank[i, hour] = position
+    rank = rank[:, :, None]
+
+    virtual_minute = rank * 60 + np.arange(60)[None, None, :]
+    phase = (virtual_minute - start_minute) % period
+    interval_start = virtual_minute - phase
+    on = ((rank >= 0)
+          & (virtual_minute >= start_minute)
+          & (phase < work)
+          & (interval_start >= rank * 60))
+    return on.reshape(n, MINUTES_PER_DAY).astype(np.uint8)
+
+
+def verify_equivalence(combinations: Sequence[Tuple[int, int, Sequence[int]]], start_minute: int = 0) -> List[int]:
+    """
+    Indexes of combinations where build_schedules() differs from create_schedule()
+    """
+    built = build_schedules(combinations, start_minute)
+    return [i for i, (work_time, sleep_time, work_hours) in enumerate(combinations)
+            if bytes(built[i]) != bytes(compile_schedule(create_schedule(list(work_hours), work_time,
+                                                                         sleep_time, start_minute)))]
+
+
+def next_transitions(bitmaps: np.ndarray) -> np.ndarray:
+    """
+    For every minute of the day - minutes until the state changes, for each bitmap of shape (n, 1440).
+    0 if the state never changes
+    """
+    bitmaps = np.atleast_2d(bitmaps)
+    result = np.zeros(bitmaps.shape, dtype=np.int32)
+    minutes = np.arange(MINUTES_PER_DAY)
+    for i, bitmap in enumerate(bitmaps):
+        # Minutes where state differs from the previous minute, the day wraps around
+        changes = np.flatnonzero(bitmap != np.roll(bitmap, 1))
+        if len(changes) == 0:
+            continue
+        changes = np.concatenate([changes, changes[:1] + MINUTES_PER_DAY])
+        result[i] = changes[np.searchsorted(changes, minutes, side='right')] - minutes
+    return result
+
+
+def poll_delay_ms(transitions: Sequence[int],
+                  seconds_of_day: float,
+                  max_ms: int,
+                  slack_ms: int = 0,
+                  min_ms: int = 0) -> int:
+    """
+    Milliseconds until the next state change of the schedule (plus slack), from its next_transitions() row,
+    limited to [min_ms, max_ms]
+    """
+    minutes = transitions[int(seconds_of_day // 60) % MINUTES_PER_DAY]
+    if not minutes:
+        return max_ms
+    delay = int((minutes * 60 - seconds_of_day % 60) * 1000) + slack_ms
+    return max(min(delay, max_ms), min_ms)
+
+
+def compile_schedule(schedule: Dict[int, List[Tuple[float, float]]]) -> bytearray:
+    """
+    Compile schedule in format of create_schedule() output
+        {
+            hour1: [(start_minute, finish_minute), ...]
+        }
+    into a day bitmap: bytearray of 1440 items, one per minute of the day, 1 - ON, 0 - OFF.
+    Like in create_schedule(), intervals are clipped to the hour, hours out of the day and empty intervals are skipped
+    """
+    bitmap = bytearray(MINUTES_PER_DAY)
+    for hour, intervals in schedule.items():
+        if not 0 <= hour < 24:
+            continue
+        offset = hour * 60
+        for start, finish in intervals:
+            start, finish = max(int(start), 0), min(int(finish), 59)
+            if finish < start:
+                continue
+            bitmap[offset + start:offset + finish + 1] = b'\x01' * (finish - start + 1)
+    return bitmap
+
+
+def parse_minutes(list_of_tuple_minutes: str) -> List[Tuple[int, int]]:
+    """
+    Parse Schedule.list_of_tuple_minutes column, e.g. "[(0, 4), (10, 14)]"
+    """
+    if not list_of_tuple_minutes:
+        return []
+    return [(int(start), int(finish)) for start, finish in ast.literal_eval(list_of_tuple_minutes)]
+
+
+def minute_of_day(now: Optional[datetime] = None) -> int:
+    now = now or datetime.now()
+    return now.hour * 60 + now.minute
+
+
+class ScheduleBook:
+    """
+    Compiled day bitmaps of the Schedule rows, keyed by schedule id.
+    A row with an empty hour applies its minutes to every hour of the day.
+    Bitmaps are recompiled only when the source of the row has changed
+    """
+    def __init__(self):
+        self.bitmaps: Dict[int, bytearray] = {}
+        self.transitions: Dict[int, np.ndarray] = {}
+        self._sources: Dict[int, Tuple[Optional[int], str]] = {}
+
+    def compile_rows(self, rows: Iterable) -> List[int]:
+        """
+        Compile models.Schedule rows (or any objects with id, hour, list_of_tuple_minutes)
+        Returns ids of recompiled schedules
+        """
+        grouped: Dict[int, List[Tuple[Optional[int], str]]] = {}
+        for row in rows:
+            grouped.setdefault(row.id, []).append((row.hour, row.list_of_tuple_minutes or ''))
+
+        changed = []
+        for schedule_id, sources in grouped.items():
+            sources = tuple(sorted(sources, key=lambda s: (-1 if s[0] is None else s[0], s[1])))
+            if self._sources.get(schedule_id) == sources:
+                continue
+            schedule: Dict[int, List[Tuple[int, int]]] = {}
+            try:
+                for hour, minutes in sources:
+                    hours = range(24) if hour is None else [hour]
+                    for h in hours:
+                        schedule.setdefault(h, []).extend(parse_minutes(minutes))
+            except (ValueError, TypeError, SyntaxError):
+                # A malformed row disables its schedule only, not the whole refresh
+                logger.exception(f'Invalid schedule {schedule_id}: {sources}')
+                schedule = {}
+            self.bitmaps[schedule_id] = compile_schedule(schedule)
+            changed.append(schedule_id)
+            self._sources[schedule_id] = sources
+
+        if changed:
+            table = next_transitions(np.array([self.bitmaps[schedule_id] for schedule_id in changed], dtype=np.uint8))
+            self.transitions.update(zip(changed, table))
+        for schedule_id in set(self.bitmaps) - set(grouped):
+            del self.bitmaps[schedule_id]
+            del self.transitions[schedule_id]
+            del self._sources[schedule_id]
+        return changed
+
+    def state(self, schedule_id: int, minute: Optional[int] = None) -> int:
+        if minute is None:
+            minute = minute_of_day()
+        return self.bitmaps[schedule_id][minute]
+
+    def next_transition(self, schedule_id: int, minute: Optional[int] = None) -> int:
+        """
+        Minutes until the state of the schedule changes, 0 if it never does
+        """
+        if minute is None:
+            minute = minute_of_day()
+        return int(self.transitions[schedule_id][minute])
@@ -4,15 +4,25 @@ from fastapi.responses import ORJSONResponse, FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import orjson
+import logging
 import traceback
 import sys
-from time import time
-from starlette.background import BackgroundTasks
+import os
+import bz2
+import copy
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
 
 
 if "src.information" in sys.modules: # for development
     import src.information as information
     import src.optimization as optimization
+    from src.result_cache import ResultCache
+    from src.grid import split_limits
+    from src.publisher import Publisher
+    from src.lanit_codec import LRU, LanitCodec
     from src.models import *
     from src.config import CONFIG
     from src.utils import format_lanit, deformat_lanit
@@ -20,15 +30,53 @@ if "src.information" in sys.modules: # for development
 else:
     import information
     import optimization
+    from result_cache import ResultCache
+    from grid import split_limits
+    from publisher import Publisher
+    from lanit_codec import LRU, LanitCodec
     from models import *
     from utils import format_lanit, deformat_lanit
     from config import CONFIG
     from main import publish
 
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(default_response_class=ORJSONResponse)
 # app.mount("/static", StaticFiles(directory=CONFIG.root_dir+"/static"), name="static")
 
+# calc_grp jobs: one thread per running job streams results of the grid chunks computed in the process pool
+grid_pool = ProcessPoolExecutor(max_workers=CONFIG.grid_processes)
+grid_jobs_executor = ThreadPoolExecutor(max_workers=CONFIG.grid_jobs)
+grid_jobs = OrderedDict()  # {message_id: 'running' | 'done' | 'failed'}, last CONFIG.grid_jobs_history jobs
+result_cache = ResultCache(os.path.join(CONFIG.root_dir, 'static'), CONFIG.cache_lifetime_sec, CONFIG.cache_max_bytes)
+# /process requests are handled here, the request is only acknowledged
+process_executor = ThreadPoolExecutor(max_workers=CONFIG.process_workers)
+# Results of all the requests go to the broker through the queue
+publisher = Publisher(publish,
+                      max_queue=CONFIG.publish_queue_size,
+                      batch_size=CONFIG.publish_batch_size,
+                      retries=CONFIG.publish_retries,
+                      backoff_ms=CONFIG.publish_backoff_ms)
+
+# Decoded request fields and formatted well lists are reused across requests
+codec = LanitCodec(deformat_lanit, format_lanit, CONFIG.codec_cache_size, CONFIG.wells_cache_size)
+# information.analogues_ results by the normalized query, dropped when the wells change
+analogues_cache = LRU(CONFIG.analogues_cache_size)
+
+
+@app.on_event("startup")
+def start_background():
+    result_cache.start(CONFIG.cache_sweep_sec)
+    publisher.start()
+
+
+@app.on_event("shutdown")
+def stop_background():
+    result_cache.stop()
+    process_executor.shutdown(wait=True)
+    publisher.stop()
+
 
 @app.get("/")
 def read_root():
@@ -38,32 +86,50 @@ def read_root():
     return HTMLResponse(content=html_content, status_code=200)
 
 
-def clear_static():
-    static_path = CONFIG.root_dir+"/static"
-    timenow = time()
-    max_time_allowed = CONFIG.cache_lifetime_sec
-    for file in os.listdir(static_path):
-        full_path =  os.path.join(static_path, file)
-        if timenow - os.path.getmtime(full_path) > max_time_allowed:
-            os.remove(full_path)
-
-
-def remove_file(filename: str) -> None:
-    os.remove(filename)
-
-
 @app.get("/calc_grp/{filename}")
-def get_file(filename: str, background_tasks: BackgroundTasks):
+def get_file(filename: str):
+    # Files stay until they expire or are evicted, so the result can be downloaded again
+    if not result_cache.touch(filename):
+        raise HTTPException(status_code=404, detail=f"File {filename} is expired or unknown")
     filepath = os.path.join(CONFIG.root_dir, "static", filename)
-    background_tasks.add_task(remove_file, filepath)
-    background_tasks.add_task(clear_static)
     if 'bz2' in filename:
         return FileResponse(filepath, media_type='application/x-bzip2')
     return FileResponse(filepath)
 
 
+@app.get("/calc_grp/status/{message_id}")
+def get_job_status(message_id: str):
+    if message_id not in grid_jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {message_id}")
+    return {'id': message_id, 'status': grid_jobs[message_id]}
+
+
+def error_payload(message_id: str, e: Exception) -> Dict[str, Any]:
+    """
+    Error to publish, with the last frames of the traceback only. The full one goes to the log
+    """
+    logger.exception(f'Request {message_id} failed')
+    return {'id': message_id,
+            'error': str(e),
+            'traceback': traceback.format_exc(limit=-CONFIG.traceback_frames)}
+
+
+@app.post("/wells/reload")
+def reload_wells():
+    """
+    Wells in the databases changed: drop formatted well lists and analogues results
+    """
+    analogues_cache.clear()
+    return {'dataset_version': codec.bump_dataset_version()}
+
+
 @app.post("/process")
-def route_message(message: str = Body(..., embed=True)):
+async def route_message(message: str = Body(..., embed=True)):
+    process_executor.submit(handle_message, message)
+    return {'status': 'accepted'}
+
+
+def handle_message(message: str) -> None:
     message_id = 'Unknown'
     request_type = 'Unstated'
     try:
@@ -76,13 +142,13 @@ def route_message(message: str = Body(..., embed=True)):
         # ===============================================================
         if request_type == 'analogs':
             # Well params
-            well_params = deformat_lanit(kwargs['Параметры'])
+            well_params = codec.decode(kwargs, 'Параметры')
 
             # Strict params
-            strict_params = deformat_lanit(kwargs['Входные параметры'])
+            strict_params = codec.decode(kwargs, 'Входные параметры')
 
             # Facies
-            facies = deformat_lanit(kwargs['Фации'])
+            facies = codec.decode(kwargs, 'Фации')
             facies_list = []
             for face, val in facies.items():
                 if val:
@@ -91,14 +157,14 @@ def route_message(message: str = Body(..., embed=True)):
                 strict_params['Категория фаций'] = facies_list
 
             # Refrac?
-            refrac = deformat_lanit(kwargs['Состояние'])
+            refrac = codec.decode(kwargs, 'Состояние')
             if refrac['Рефрак'] and not refrac['Новая']:
                 strict_params['Идентификатор повторного ГРП'] = 1
             elif refrac['Новая'] and not refrac['Рефрак']:
                 strict_params['Идентификатор повторного ГРП'] = 0
 
             # Calculation method
-            calc_method = deformat_lanit(kwargs['Метод расчета'])
+            calc_method = codec.decode(kwargs, 'Метод расчета')
             if calc_method['Евклидово расстояние']:
                 calc_method = 'Euclid'
             else:
@@ -108,7 +174,7 @@ def route_message(message: str = Body(..., embed=True)):
             use_coords = False
             coordinates = None
             radius = 99_999_999
-            coords = deformat_lanit(kwargs['Поиск в радиусе'], add_if_empty=True)
+            coords = codec.decode(kwargs, 'Поиск в радиусе')
             if coords['X'] != '':
                 use_coords = True
                 coordinates = {'X': coords['X'], 'Y': coords['Y']}
@@ -123,11 +189,11 @@ def route_message(message: str = Body(..., embed=True)):
         # ===============================================================
         elif request_type == 'all_wells':
             field = kwargs['Месторождение']['value']
-            ans = format_lanit(get_wells(field))
+            ans = codec.formatted_wells(field, get_wells)
         # ===============================================================
         elif request_type == 'calc_grp':
             # в options: "ID модели" "Плотность проппанта" "Масса пропанта" "Шаг сетки оптимизации"
-            options = deformat_lanit(kwargs['Опции оптимизации'])
+            options = codec.decode(kwargs, 'Опции оптимизации')
             model_name = options['ID модели']
             prop_dens = options['Плотность проппанта']
             step = options['Шаг сетки оптимизации']
@@ -136,19 +202,22 @@ def route_message(message: str = Body(..., embed=True)):
                 prop_mass = options['Масса пропанта']
 
             # boundaries[param]: [min, max]
-            boundaries = deformat_lanit(kwargs['Границы параметров'])
-
-            well_params = deformat_lanit(kwargs['Целевая скважина'], add_if_empty=True)
-
-            df, optimum = optimize_grid(model_name, well_params, step, boundaries, prop_mass, prop_dens)
-
-            df.to_csv(os.path.join(CONFIG.root_dir, 'static', f'id_{message_id}.csv.bz2'),
-                      compression='bz2',
-                      index=False)
-
-            result_filepath = f'calc_grp/id_{message_id}.csv.bz2'
-            ans = {'result_grid': result_filepath,
-                   'optimum': format_lanit(optimum)[0]}
+            boundaries = codec.decode(kwargs, 'Границы параметров')
+
+            well_params = codec.decode(kwargs, 'Целевая скважина')
+
+            # Same inputs as a cached result: reuse its file
+            inputs_key = hashlib.sha256(orjson.dumps([model_name, well_params, step, boundaries, prop_mass, prop_dens],
+                                                     option=orjson.OPT_SORT_KEYS)).hexdigest()
+            ans = result_cache.lookup(inputs_key)
+            if ans is None:
+                # Result is published by the job, the request only acknowledges it
+                grid_jobs[message_id] = 'running'
+                while len(grid_jobs) > CONFIG.grid_jobs_history:
+                    grid_jobs.popitem(last=False)
+                grid_jobs_executor.submit(run_grid_job, message_id, inputs_key, model_name, well_params, step,
+                                          boundaries, prop_mass, prop_dens)
+                return
         # ===============================================================
         else:
             ans = {'error': f"Wrong request type ({request_type})"}
@@ -157,12 +226,80 @@ def route_message(message: str = Body(..., embed=True)):
         payload_out = {'id': message_id,
                        'type': request_type,
                        'data': ans}
-        publish(orjson.dumps(payload_out).decode('utf-8'))
+        publisher.publish(payload_out)
     except Exception as e:
+        publisher.publish(error_payload(message_id, e))
+
+
+def run_grid_job(message_id: str,
+                 inputs_key: str,
+                 model_name: str,
+                 well_params: Dict[str, Any],
+                 step: int,
+                 boundaries: Dict[str, List[float]],
+                 prop_mass: float,
+                 prop_dens: float) -> None:
+    try:
+        optimum = optimize_grid_streaming(model_name, well_params, step, boundaries, prop_mass, prop_dens,
+                                          os.path.join(CONFIG.root_dir, 'static', f'id_{message_id}.csv.bz2'))
+        result_filepath = f'calc_grp/id_{message_id}.csv.bz2'
+        ans = {'result_grid': result_filepath,
+               'optimum': format_lanit(optimum)[0]}
+        result_cache.add(f'id_{message_id}.csv.bz2', inputs_key, ans)
         payload_out = {'id': message_id,
-                       'error': str(e),
-                       'traceback': traceback.format_exc()}
-        publish(orjson.dumps(payload_out).decode('utf-8'))
+                       'type': 'calc_grp',
+                       'data': ans}
+        grid_jobs[message_id] = 'done'
+    except Exception as e:
+        grid_jobs[message_id] = 'failed'
+        payload_out = error_payload(message_id, e)
+    publisher.publish(payload_out)
+
+
+def optimize_grid_streaming(model_name: str,
+                            well_params: Dict[str, Any],
+                            step: int,
+                            limits: Dict[str, List[float]],
+                            prop_mass: float,
+                            prop_dens: float,
+                            output_path: str):
+    """
+    optimize_grid() over chunks of the grid in the process pool.
+    Every chunk is appended to the bz2 csv as soon as it is ready, so only the chunks in flight are kept in memory:
+    at most CONFIG.grid_in_flight chunks of CONFIG.grid_chunk_points grid points.
+    Returns the best of the chunk optimums by the last column of the grid (the predicted target)
+    """
+    best, best_value = None, None
+    parts = split_limits(limits, step, CONFIG.grid_chunks, CONFIG.grid_chunk_points)
+    # At most CONFIG.grid_in_flight chunks are submitted and not yet written
+    pending = {grid_pool.submit(optimize_grid, model_name, well_params, step, part, prop_mass, prop_dens)
+               for part in islice(parts, CONFIG.grid_in_flight)}
+    # The file appears under its name only when complete
+    tmp_path = output_path + '.part'
+    try:
+        with bz2.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+            header = True
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    df, optimum = future.result()
+                    df.to_csv(f, header=header, index=False)
+                    header = False
+                    value = optimum[df.columns[-1]].iloc[0]
+                    if best_value is None or value > best_value:
+                        best, best_value = optimum, value
+                    del df
+                    for part in islice(parts, 1):
+                        pending.add(grid_pool.submit(optimize_grid, model_name, well_params, step, part,
+                                                     prop_mass, prop_dens))
+                del done
+        os.replace(tmp_path, output_path)
+    finally:
+        for future in pending:
+            future.cancel()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return best
 
 
 def analogues_boundaries(well_params: Dict,
@@ -186,12 +323,22 @@ def analogues_boundaries(well_params: Dict,
     <b>top_N</b> - количество скважин-аналогов для отображения. Максимум - 30.\n
     <b>weighted</b> - использование весов (STD) для расчёта Евклидового расстояния.
     """
-    return information.analogues_(well_params=well_params,
-                                  strict_params=strict_params,
-                                  use_coords=use_coords,
-                                  coordinates=coordinates,
-                                  radius=radius,
-                                  calc_method=calc_method)
+    query = dict(well_params=well_params,
+                 strict_params=strict_params,
+                 use_coords=use_coords,
+                 coordinates=coordinates,
+                 radius=radius,
+                 calc_method=calc_method)
+    try:
+        key = orjson.dumps(query, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return information.analogues_(**query)
+    analogues = analogues_cache.get(key)
+    if analogues is None:
+        analogues = information.analogues_(**query)
+        analogues_cache.put(key, analogues)
+    # Cached result is shared between requests
+    return copy.deepcopy(analogues)
 
 
 def get_wells(db_name: str):
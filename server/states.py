@@ -0,0 +1,103 @@
+from typing import Any, Dict, Optional
+
+import aioredis
+
+from server.metrics import metrics
+
+
+# Every board keeps all of its fields in one redis hash named after the board
+BOARD_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'farm': {'custom': 'forcibly_off', 'ledstate': 1},
+    'coco': {'coco_led': 1, 'led_temp': 0.0},
+}
+# Board whose hash holds the field, for fields changed from the frontend
+FIELD_BOARDS: Dict[str, str] = {field: board
+                                for board, fields in BOARD_DEFAULTS.items()
+                                for field in fields}
+# Boards with fields the user can change at any time
+USER_BOARDS = frozenset(FIELD_BOARDS.values())
+# Fields written by the boards themselves
+READING_FIELDS = frozenset({'led_temp'})
+
+# Move a top-level string key of the old layout into the board hash
+MIGRATE = """
+local value = redis.call('get', KEYS[1])
+if value then
+    redis.call('hset', KEYS[2], KEYS[1], value)
+    redis.call('del', KEYS[1])
+end
+return value
+"""
+
+
+async def sync_board(redis: aioredis.Redis,
+                     board: str,
+                     readings: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Single round trip to redis for the board: write readings from the board, read back the whole hash.
+    Missing fields are filled with defaults in memory only, defaults are written to redis by the leader
+    with seed_defaults() after the journal is restored, so they never mask restored overrides
+    """
+    metrics.inc('redis_calls_total', op='sync_board')
+    with metrics.timer('redis', 'sync_board'):
+        async with redis.pipeline(transaction=True) as pipe:
+            if readings:
+                pipe.hset(board, mapping=readings)
+            pipe.hgetall(board)
+            result = await pipe.execute()
+    states = {field: str(value) for field, value in BOARD_DEFAULTS.get(board, {}).items()}
+    states.update(result[-1])
+    return states
+
+
+async def seed_defaults(redis: aioredis.Redis) -> None:
+    """
+    Write defaults of the fields missing in redis
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        for board, defaults in BOARD_DEFAULTS.items():
+            for field, value in defaults.items():
+                pipe.hsetnx(board, field, value)
+        await pipe.execute()
+
+
+async def migrate_legacy_keys(redis: aioredis.Redis) -> Dict[str, Dict[str, str]]:
+    """
+    States were kept in top-level keys (custom, ledstate, coco_led, led_temp) before one hash per board.
+    Moves the ones left into the board hashes, returns moved fields by board. A no-op once migrated
+    """
+    migrate = redis.register_script(MIGRATE)
+    moved: Dict[str, Dict[str, str]] = {}
+    for field, board in FIELD_BOARDS.items():
+        try:
+            value = await migrate(keys=[field, board])
+        except aioredis.ResponseError:
+            # Not a string key, not ours
+            continue
+        if value is not None:
+            moved.setdefault(board, {})[field] = value
+    return moved
+
+
+async def set_field(redis: aioredis.Redis, field: str, value: Any) -> str:
+    """
+    Set field in the hash of the board it belongs to. Returns board name
+    """
+    board = FIELD_BOARDS[field]
+    metrics.inc('redis_calls_total', op='set_field')
+    with metrics.timer('redis', 'set_field'):
+        await redis.hset(board, field, value)
+    return board
+
+
+async def set_defaults(redis: aioredis.Redis, field: Optional[str] = None) -> None:
+    """
+    Overwrite the field (or all the fields if not given) with default values
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        for board, defaults in BOARD_DEFAULTS.items():
+            if field is None:
+                pipe.hset(board, mapping=defaults)
+            elif field in defaults:
+                pipe.hset(board, field, defaults[field])
+        await pipe.execute()
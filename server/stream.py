@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Set
+
+from config import CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    __slots__ = ('frames', 'resync', 'event')
+
+    def __init__(self):
+        self.frames: Deque[bytes] = deque()
+        self.resync = True
+        self.event = asyncio.Event()
+
+    def push(self, frame: bytes, max_queue: int) -> None:
+        # A slow client gets one snapshot instead of the backlog of deltas
+        if len(self.frames) >= max_queue:
+            self.frames.clear()
+            self.resync = True
+        else:
+            self.frames.append(frame)
+        self.event.set()
+
+
+class StateStream:
+    """
+    One producer for all the dashboard clients: boards marked as changed are read once per tick,
+    the delta {board: {field: value}} is encoded once and fanned out to every subscriber.
+    Ticks are capped at `fps`, changes within a tick are coalesced
+    """
+    def __init__(self,
+                 load: Callable[[str], Awaitable[Dict[str, str]]],
+                 fps: float = CONFIG.stream_fps,
+                 max_queue: int = CONFIG.stream_max_queue):
+        self.load = load
+        self.period = 1 / fps
+        self.max_queue = max_queue
+        self.subscribers: Set[Subscriber] = set()
+        self._snapshot: Dict[str, Dict[str, str]] = {}
+        self._snapshot_frame: Optional[bytes] = None
+        self._dirty: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def mark(self, board: Optional[str] = None) -> None:
+        """
+        Board states were changed, None - all known boards
+        """
+        if board is None:
+            self._dirty.update(self._snapshot)
+        else:
+            self._dirty.add(board)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def snapshot_frame(self) -> bytes:
+        if self._snapshot_frame is None:
+            self._snapshot_frame = b'event: snapshot\ndata: ' + json.dumps(self._snapshot).encode() + b'\n\n'
+        return self._snapshot_frame
+
+    async def tick(self) -> None:
+        boards, self._dirty = self._dirty, set()
+        try:
+            loaded = {board: await self.load(board) for board in boards}
+        except Exception:
+            # Nothing is applied, all the boards are read again on the next tick
+            self._dirty.update(boards)
+            raise
+        delta = {}
+        for board, states in loaded.items():
+            previous = self._snapshot.get(board, {})
+            changed = {field: value for field, value in states.items() if previous.get(field) != value}
+            if changed:
+                delta[board] = changed
+                self._snapshot[board] = dict(states)
+        if not delta:
+            return
+        self._snapshot_frame = None
+        frame = b'data: ' + json.dumps(delta).encode() + b'\n\n'
+        for subscriber in self.subscribers:
+            subscriber.push(frame, self.max_queue)
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self._dirty:
+            self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.subscribers:
+                try:
+                    await self.tick()
+                except Exception:
+                    logger.exception('State stream tick failed, retrying')
+                    self._wakeup.set()
+                    await asyncio.sleep(1)
+            else:
+                self._dirty.clear()
+                self._snapshot.clear()
+                self._snapshot_frame = None
+            await asyncio.sleep(self.period)
+
+    async def subscribe(self, boards: Optional[Set[str]] = None) -> AsyncIterator[bytes]:
+        """
+        Server-Sent Events: snapshot first, then deltas. Boards to start with are read before the snapshot
+        """
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        try:
+            for board in boards or ():
+                if board not in self._snapshot:
+                    self._snapshot[board] = dict(await self.load(board))
+                    self._snapshot_frame = None
+            while True:
+                subscriber.event.clear()
+                if subscriber.resync:
+                    subscriber.resync = False
+                    subscriber.frames.clear()
+                    yield self.snapshot_frame()
+                while subscriber.frames:
+                    yield subscriber.frames.popleft()
+                if subscriber.event.is_set():
+                    continue
+                try:
+                    await asyncio.wait_for(subscriber.event.wait(), CONFIG.stream_keepalive_sec)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+        finally:
+            self.subscribers.discard(subscriber)
@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+from time import monotonic, time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aioredis
+
+from config import CONFIG
+
+
+logger = logging.getLogger(__name__)
+
+
+class Trigger:
+    """
+    Runtime copy of models.Triggers row:
+    when `on` sensor turns non-zero, set `do` to `set`;
+    revert it after `for_seconds` or when `until_sensor_id` reports `until_sensor_val`
+    """
+    __slots__ = ('id', 'on', 'do', 'set', 'for_seconds', 'until_sensor_id', 'until_sensor_val')
+
+    def __init__(self, id, on, do, set, for_seconds=None, until_sensor_id=None, until_sensor_val=None):
+        self.id = id
+        self.on = on
+        self.do = do
+        self.set = set
+        self.for_seconds = for_seconds
+        self.until_sensor_id = until_sensor_id
+        self.until_sensor_val = until_sensor_val
+
+    @classmethod
+    def from_row(cls, row) -> 'Trigger':
+        return cls(row.id, row.on, row.do, row.set, row.for_seconds, row.until_sensor_id, row.until_sensor_val)
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'cancelled')
+
+    def __init__(self, deadline: float, callback: Callable[[], Awaitable[None]]):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    All delayed actions in one heap served by a single task, instead of a sleeping task per action.
+    Cancelled timers stay in the heap and are skipped when due
+    """
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Timer]] = []
+        self._counter = itertools.count()
+        self._changed: Optional[asyncio.Event] = None
+
+    def schedule(self, delay: float, callback: Callable[[], Awaitable[None]]) -> Timer:
+        timer = Timer(monotonic() + delay, callback)
+        heapq.heappush(self._heap, (timer.deadline, next(self._counter), timer))
+        # Wake the loop if the new timer is the earliest one
+        if self._changed is not None and self._heap[0][2] is timer:
+            self._changed.set()
+        return timer
+
+    def next_deadline(self) -> Optional[float]:
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    async def run(self) -> None:
+        self._changed = asyncio.Event()
+        while True:
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max(deadline - monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            now = monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                timer = heapq.heappop(self._heap)[2]
+                if timer.cancelled:
+                    continue
+                try:
+                    await timer.callback()
+                except Exception:
+                    logger.exception('Timer callback failed')
+
+
+class TriggerStore:
+    """
+    Active triggers in a redis hash {trigger_id: [do, set, deadline]}, deadline is unix time or None,
+    so a new leader takes over the triggers and timers of the old one
+    """
+    def __init__(self, redis: aioredis.Redis, key: str = CONFIG.active_triggers_key):
+        self.redis = redis
+        self.key = key
+
+    async def save(self, trigger: Trigger, deadline: Optional[float]) -> None:
+        await self.redis.hset(self.key, trigger.id, json.dumps([trigger.do, trigger.set, deadline]))
+
+    async def remove(self, trigger_id: int) -> None:
+        await self.redis.hdel(self.key, trigger_id)
+
+    async def load(self) -> Dict[int, Tuple[int, int, Optional[float]]]:
+        return {int(trigger_id): tuple(json.loads(value))
+                for trigger_id, value in (await self.redis.hgetall(self.key)).items()}
+
+
+class TriggerEngine:
+    """
+    Triggers indexed by the source sensor (Thing id), so a reading evaluates only the triggers depending on it.
+    `apply(thing_id, value)` sets required state of the thing,
+    `restore(thing_id, fallback)` gives the thing back to whatever controlled it before the trigger
+    (fallback is the value for things with nothing to go back to).
+    Active triggers are counted per target thing, it is restored when the last of them is released.
+    With a store, active triggers are saved to redis and resume() picks them up after failover
+    """
+    def __init__(self,
+                 apply: Callable[[int, int], Awaitable[None]],
+                 restore: Callable[[int, int], Awaitable[None]],
+                 store: Optional[TriggerStore] = None):
+        self.apply = apply
+        self.restore = restore
+        self.store = store
+        self.timers = TimerWheel()
+        self._by_id: Dict[int, Trigger] = {}
+        self._by_sensor: Dict[int, List[Trigger]] = {}
+        self._by_until_sensor: Dict[int, List[Trigger]] = {}
+        self._targets: Set[int] = set()
+        self._active: Dict[int, Optional[Timer]] = {}
+        self._refs: Dict[int, int] = {}
+        self._last: Dict[int, float] = {}
+
+    def load(self, triggers: Iterable[Trigger]) -> None:
+        by_sensor: Dict[int, List[Trigger]] = {}
+        by_until_sensor: Dict[int, List[Trigger]] = {}
+        targets: Set[int] = set()
+        by_id: Dict[int, Trigger] = {}
+        for trigger in triggers:
+            by_id[trigger.id] = trigger
+            targets.add(trigger.do)
+            by_sensor.setdefault(trigger.on, []).append(trigger)
+            if trigger.until_sensor_id is not None:
+                by_until_sensor.setdefault(trigger.until_sensor_id, []).append(trigger)
+        self._by_sensor = by_sensor
+        self._by_until_sensor = by_until_sensor
+        self._targets = targets
+        self._by_id = by_id
+
+    def watches(self, thing_id: int) -> bool:
+        return thing_id in self._by_sensor or thing_id in self._by_until_sensor
+
+    def targets(self, thing_id: int) -> bool:
+        """
+        The thing is set by a trigger, at any moment from the board's point of view
+        """
+        return thing_id in self._targets
+
+    async def on_reading(self, thing_id: int, value: float) -> None:
+        previous = self._last.get(thing_id)
+        self._last[thing_id] = value
+
+        for trigger in self._by_until_sensor.get(thing_id, ()):
+            if trigger.id in self._active and value == trigger.until_sensor_val:
+                await self._release(trigger)
+
+        # Fire on rising edge only, a sensor staying ON doesn't restart the action
+        if value and not previous:
+            for trigger in self._by_sensor.get(thing_id, ()):
+                await self._fire(trigger)
+
+    async def _fire(self, trigger: Trigger) -> None:
+        if trigger.id in self._active:
+            timer = self._active.pop(trigger.id)
+            if timer is not None:
+                timer.cancel()
+        else:
+            self._refs[trigger.do] = self._refs.get(trigger.do, 0) + 1
+        await self.apply(trigger.do, trigger.set)
+        timer = None
+        if trigger.for_seconds:
+            timer = self.timers.schedule(trigger.for_seconds, lambda: self._release(trigger))
+        self._active[trigger.id] = timer
+        if self.store is not None:
+            await self.store.save(trigger, time() + trigger.for_seconds if trigger.for_seconds else None)
+
+    async def _release(self, trigger: Trigger) -> None:
+        if trigger.id not in self._active:
+            return
+        timer = self._active.pop(trigger.id)
+        if timer is not None:
+            timer.cancel()
+        if self.store is not None:
+            await self.store.remove(trigger.id)
+        self._refs[trigger.do] -= 1
+        if self._refs[trigger.do] > 0:
+            # Another active trigger still holds the thing
+            return
+        del self._refs[trigger.do]
+        await self.restore(trigger.do, int(not trigger.set))
+
+
+    async def resume(self) -> None:
+        """
+        Take over active triggers saved by the previous leader: timers are scheduled for what is left of them,
+        triggers deleted from the configuration meanwhile are released right away
+        """
+        if self.store is None:
+            return
+        for trigger_id, (do, value, deadline) in (await self.store.load()).items():
+            if trigger_id in self._active:
+                continue
+            trigger = self._by_id.get(trigger_id)
+            stale = trigger is None or trigger.do != do
+            if stale:
+                trigger = Trigger(trigger_id, None, do, value)
+            self._refs[do] = self._refs.get(do, 0) + 1
+            timer = None
+            if deadline is not None:
+                timer = self.timers.schedule(max(deadline - time(), 0),
+                                             lambda trigger=trigger: self._release(trigger))
+            self._active[trigger_id] = timer
+            if stale:
+                await self._release(trigger)
+
+    def reset(self) -> None:
+        """
+        Forget in-process state on demotion, the new leader resumes the triggers from the store
+        """
+        self.timers = TimerWheel()
+        self._active.clear()
+        self._refs.clear()
+        self._last.clear()
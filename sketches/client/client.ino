@@ -59,6 +59,7 @@ void setup() {
 
 
 void loop() {
+    unsigned long wait = interval;
     pinMode(LED_BUILTIN, OUTPUT);
     pinMode(compressor, OUTPUT);
     if (WiFi.status() == WL_CONNECTED) { //Check WiFi connection status
@@ -75,12 +76,14 @@ void loop() {
             http.end();
 
             digitalWrite(compressor, doc["LED"].as<bool>());
+            // Server tells when the states will change next
+            wait = doc["next_poll_ms"] | interval;
         }
         else {
             Serial.println("Unable to request");
         }
     }
-  delay(interval);
+  delay(wait);
 }
 
 
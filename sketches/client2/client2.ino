@@ -66,6 +66,7 @@ void setup() {
 
 
 void loop() {
+    unsigned long wait = interval;
     pinMode(LED_BUILTIN, OUTPUT);
     pinMode(LED_PIN, OUTPUT);
     if (WiFi.status() == WL_CONNECTED) { //Check WiFi connection status
@@ -82,12 +83,14 @@ void loop() {
             http.end();
 
             digitalWrite(LED_PIN, doc["coco_led"].as<bool>());
+            // Server tells when the states will change next
+            wait = doc["next_poll_ms"] | interval;
         }
         else {
             Serial.println("Unable to request");
         }
     }
-  delay(interval);
+  delay(wait);
 }
 
 
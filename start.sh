@@ -1 +1 @@
-redis-server && python -m server.main
\ No newline at end of file
+redis-server --daemonize yes && uvicorn server.main:app --host 0.0.0.0 --port 8000 --workers ${WORKERS:-1}
\ No newline at end of file
@@ -9,3 +9,20 @@ export const outgoing = writable({});
 //     },
 //     ...
 // }
+
+// Server-Sent Events from /stream: full snapshot first, then changed fields only
+if (typeof window !== 'undefined') {
+    const source = new EventSource('/stream');
+    source.addEventListener('snapshot', (event) => {
+        incoming.set(JSON.parse(event.data));
+    });
+    source.onmessage = (event) => {
+        const delta = JSON.parse(event.data);
+        incoming.update((boards) => {
+            for (const [board, sensors] of Object.entries(delta)) {
+                boards[board] = {...boards[board], ...sensors};
+            }
+            return boards;
+        });
+    };
+}
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture
+def main(tmp_path):
+    """
+    server.main against fakeredis, with fresh in-process state
+    """
+    from bench.asgi import use_fake_redis
+    from db.journal import StateJournal
+    from server import main
+
+    use_fake_redis(main)
+    main.journal = StateJournal(str(tmp_path / 'journal'))
+    main.state_cache.invalidate()
+    main.triggers = main.TriggerEngine(main.apply_trigger, main.restore_trigger, main.TriggerStore(main.redis))
+    return main
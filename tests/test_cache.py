@@ -0,0 +1,27 @@
+import asyncio
+
+from server import cache
+
+
+def test_read_racing_invalidation_is_not_stored(main, monkeypatch):
+    reads = []
+
+    async def sync_board(redis, board, readings=None):
+        states = {'coco_led': str(len(reads))}
+        reads.append(states)
+        if len(reads) == 1:
+            # State is changed and invalidated while the first read is in flight
+            await asyncio.sleep(0.05)
+        return states
+
+    monkeypatch.setattr(cache, 'sync_board', sync_board)
+
+    async def scenario():
+        state_cache = main.state_cache
+        read = asyncio.create_task(state_cache.sync('coco'))
+        await asyncio.sleep(0.01)
+        state_cache.invalidate('coco')
+        assert (await read)['coco_led'] == '0'
+        assert (await state_cache.sync('coco'))['coco_led'] == '1'
+
+    asyncio.run(scenario())
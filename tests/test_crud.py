@@ -0,0 +1,35 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.sql import crud, models
+from db.sql.database import Base
+
+
+def test_writes_run_commit_hooks(tmp_path, monkeypatch):
+    commits = []
+
+    async def hook():
+        commits.append(1)
+
+    async def failing_hook():
+        raise ConnectionError('redis unavailable')
+
+    monkeypatch.setattr(crud, '_commit_hooks', [])
+    crud.on_commit(failing_hook)
+    crud.on_commit(hook)
+
+    async def scenario():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as db:
+            board = await crud.create_board(db, 'greenhouse')
+            await crud.create_schedule(db, '[(0, 30)]', hour=8)
+            assert await crud.delete_by_id(db, models.Board, board.id) == 1
+            assert await crud.get_boards(db) == []
+        await engine.dispose()
+
+    asyncio.run(scenario())
+    assert len(commits) == 3
@@ -0,0 +1,13 @@
+import asyncio
+
+import pytest
+
+from bench.fleet import parse_args, run
+
+
+@pytest.mark.parametrize('encoding', [[], ['--msgpack']])
+def test_fleet_smoke(main, encoding):
+    stats = asyncio.run(run(parse_args(['--boards', '20', '--interval', '0.5', '--jitter', '0.1',
+                                        '--duration', '2', '--hints', *encoding])))
+    assert not stats.errors
+    assert set(stats.latencies) == {'farm', 'coco'}
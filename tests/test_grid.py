@@ -0,0 +1,39 @@
+from itertools import product
+
+from server.grid import grid_points, split_limits
+
+
+def points(limits, step):
+    axes = [[round(lower + i * step, 6) for i in range(grid_points(lower, upper, step))]
+            for lower, upper in limits.values()]
+    return list(product(*axes))
+
+
+def check(limits, step, chunks, max_points):
+    parts = list(split_limits(limits, step, chunks, max_points))
+    covered = [point for part in parts for point in points(part, step)]
+    assert all(len(points(part, step)) <= max_points for part in parts)
+    # Every grid point exactly once
+    assert sorted(covered) == sorted(points(limits, step))
+    assert all(list(part) == list(limits) for part in parts)
+    return parts
+
+
+def test_small_grid_is_spread_over_chunks():
+    parts = check({'a': [0, 9], 'b': [0, 1]}, 1, 4, 1000)
+    assert len(parts) >= 4
+
+
+def test_parts_are_bounded_by_points():
+    parts = check({'a': [0, 99], 'b': [0, 49], 'c': [0, 4]}, 1, 4, 300)
+    assert len(parts) >= 100 * 50 * 5 // 300
+
+
+def test_split_across_parameters_with_few_points():
+    # Every parameter has fewer points than there are chunks
+    check({'a': [0, 2], 'b': [0, 2], 'c': [0, 2]}, 1, 16, 2)
+    check({'a': [0.5, 1.5], 'b': [10, 11]}, 0.25, 3, 1)
+
+
+def test_whole_grid_fits():
+    assert list(split_limits({'a': [0, 3]}, 1, 1, 10)) == [{'a': [0, 3]}]
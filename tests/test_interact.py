@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import msgpack
+
+from bench.asgi import request
+
+
+def interact(main, body: bytes, content_type: str):
+    return asyncio.run(request(main.app, 'POST', '/interact', body, [('content-type', content_type)]))
+
+
+def test_interact_json(main):
+    for board in ('farm', 'coco'):
+        status, _, payload = interact(main, json.dumps({'name': board}).encode(), 'application/json')
+        assert status == 200
+        states = json.loads(payload)
+        assert main.CONFIG.min_poll_ms <= states['next_poll_ms'] <= main.CONFIG.max_poll_ms
+
+
+def test_interact_msgpack(main):
+    status, _, payload = interact(main, msgpack.packb(['coco', 0, {'led_temp': 21.5}]), 'application/msgpack')
+    assert status == 200
+    assert len(msgpack.unpackb(payload)) == 2
+
+
+def test_interact_unknown_board(main):
+    status, _, _ = interact(main, json.dumps({'name': 'nope'}).encode(), 'application/json')
+    assert status == 404
+
+
+def test_user_controlled_boards_poll_often(main):
+    # coco has no schedule, its coco_led is changed from /process at any time
+    for board in ('farm', 'coco'):
+        _, _, payload = interact(main, json.dumps({'name': board}).encode(), 'application/json')
+        assert json.loads(payload)['next_poll_ms'] <= main.CONFIG.poll_interval_ms
+
+
+def test_interact_accepts_non_numeric_readings(main):
+    for led_temp in (None, 'n/a', 'nan'):
+        status, _, _ = interact(main, json.dumps({'name': 'coco', 'led_temp': led_temp}).encode(), 'application/json')
+        assert status == 200
+
+
+def test_unknown_custom_is_rejected_and_dashboard_renders(main):
+    async def scenario():
+        status, _, _ = await request(main.app, 'POST', '/process', b'"custom=bogus"',
+                                     [('content-type', 'application/json')])
+        assert status == 302
+        assert (await main.state_cache.sync('farm'))['custom'] == 'forcibly_off'
+        await request(main.app, 'POST', '/process', b'"custom=normal"', [('content-type', 'application/json')])
+        assert (await main.state_cache.sync('farm'))['custom'] == 'normal'
+        # Left by an older version
+        await main.redis.hset('farm', 'custom', 'bogus')
+        main.state_cache.invalidate()
+        status, _, body = await request(main.app, 'GET', '/')
+        assert status == 200 and b'OFF' in body
+
+    asyncio.run(scenario())
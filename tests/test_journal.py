@@ -0,0 +1,89 @@
+import asyncio
+
+from db.journal import StateJournal
+
+
+def test_load_compact_and_history(tmp_path):
+    journal = StateJournal(str(tmp_path), compact_bytes=1, keep_segments=1)
+    journal.record('farm', {'custom': 'normal'}, 'process')
+    journal.record('coco', {'coco_led': 0}, 'process')
+    asyncio.run(journal.flush())
+    assert journal.compact()
+    journal.record('farm', {'custom': 'neglect_hours'}, 'process')
+    # Trigger values are not restorable state
+    journal.record('coco', {'coco_led': 1}, 'trigger')
+    asyncio.run(journal.flush())
+    # Torn record of a crashed writer at the end of the log
+    with open(journal.log_path, 'ab') as f:
+        f.write(b'\x00\x00\x00\x09ab')
+
+    assert journal.load() == {'farm': {'custom': 'neglect_hours'}, 'coco': {'coco_led': 0}}
+    assert [record[2] for record in journal.history('farm')] == [{'custom': 'normal'}, {'custom': 'neglect_hours'}]
+    assert [record[3] for record in journal.history('coco')] == ['process', 'trigger']
+    assert journal.compact()
+    assert len(journal.segments()) == 1
+    assert journal.load() == {'farm': {'custom': 'neglect_hours'}, 'coco': {'coco_led': 0}}
+
+
+def test_writer_task(tmp_path):
+    journal = StateJournal(str(tmp_path))
+
+    async def scenario():
+        journal.start()
+        journal.record('coco', {'coco_led': 1}, 'process')
+        # Nothing is written from the request path
+        assert journal.load() == {}
+        await asyncio.sleep(0.1)
+        assert journal.load() == {'coco': {'coco_led': 1}}
+        journal.record('coco', {'coco_led': 0}, 'process')
+        await journal.stop()
+
+    asyncio.run(scenario())
+    assert journal.load() == {'coco': {'coco_led': 0}}
+
+
+def test_restore_after_redis_restart(main):
+    main.journal.record('farm', {'custom': 'normal'}, 'process')
+
+    async def scenario():
+        # A poll reaches a worker before the leader has restored the journal
+        states = await main.state_cache.sync('farm')
+        assert states['custom'] == 'forcibly_off'
+        await main.restore_states()
+        await main.get_states()
+        assert (await main.redis.hgetall('farm'))['custom'] == 'normal'
+        assert (await main.state_cache.sync('farm'))['custom'] == 'normal'
+
+    asyncio.run(scenario())
+
+
+def test_restore_runs_only_after_redis_lost_data(main):
+    main.journal.record('farm', {'custom': 'normal'}, 'process')
+
+    async def scenario():
+        await main.restore_states()
+        # Another worker's change, not flushed to the journal yet
+        await main.redis.hset('farm', 'custom', 'neglect_hours')
+        # Re-election with redis intact
+        await main.restore_states()
+        assert (await main.redis.hgetall('farm'))['custom'] == 'neglect_hours'
+
+    asyncio.run(scenario())
+
+
+def test_legacy_keys_are_migrated(main):
+    async def scenario():
+        await main.redis.set('custom', 'normal')
+        await main.redis.set('led_temp', '22.5')
+        await main.migrate_states()
+        await main.restore_states()
+        await main.get_states()
+        assert await main.redis.exists('custom', 'led_temp') == 0
+        assert (await main.state_cache.sync('farm'))['custom'] == 'normal'
+        assert (await main.state_cache.sync('coco'))['led_temp'] == '22.5'
+        await main.migrate_states()
+        assert (await main.redis.hgetall('farm'))['custom'] == 'normal'
+
+    asyncio.run(scenario())
+    # Overrides survive a redis restart, readings are not journaled
+    assert main.journal.load() == {'farm': {'custom': 'normal'}}
@@ -0,0 +1,58 @@
+from server.lanit_codec import LRU, LanitCodec
+
+
+class Calls:
+    def __init__(self):
+        self.deformat = 0
+        self.format = 0
+
+
+def codec_with_calls():
+    calls = Calls()
+
+    def deformat(value, add_if_empty=False):
+        calls.deformat += 1
+        return {'value': list(value), 'add_if_empty': add_if_empty}
+
+    def format(wells):
+        calls.format += 1
+        return [{'well': well} for well in wells]
+
+    return LanitCodec(deformat, format, cache_size=2, wells_cache_size=2), calls
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRU(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert lru.get('b') is None and lru.get('a') == 1 and lru.get('c') == 3
+    assert (lru.hits, lru.misses) == (3, 1)
+
+
+def test_decoded_fields_are_memoized_and_isolated():
+    codec, calls = codec_with_calls()
+    kwargs = {'Фации': [1, 2], 'Поиск в радиусе': [3]}
+    first = codec.decode(kwargs, 'Фации')
+    first['value'].append(3)
+    assert codec.decode(kwargs, 'Фации') == {'value': [1, 2], 'add_if_empty': False}
+    assert calls.deformat == 1
+    # Options of the field are passed to deformat_lanit
+    assert codec.decode(kwargs, 'Поиск в радиусе')['add_if_empty'] is True
+    # Values orjson can't serialize are decoded every time
+    codec.decode({'Фации': {1j}}, 'Фации')
+    codec.decode({'Фации': {1j}}, 'Фации')
+    assert calls.deformat == 4
+
+
+def test_dataset_version_bump_drops_formatted_wells():
+    codec, calls = codec_with_calls()
+    wells = {'field': ['w1']}
+    assert codec.formatted_wells('field', wells.get) == [{'well': 'w1'}]
+    codec.formatted_wells('field', wells.get)
+    assert calls.format == 1
+    wells['field'] = ['w1', 'w2']
+    assert codec.bump_dataset_version() == 1
+    assert codec.formatted_wells('field', wells.get) == [{'well': 'w1'}, {'well': 'w2'}]
+    assert calls.format == 2
@@ -0,0 +1,57 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from server.leader import LeaderLease
+
+
+class FlakyRedis:
+    """
+    Redis client whose calls fail while `failing` is set
+    """
+    def __init__(self, redis):
+        self.redis = redis
+        self.failing = False
+
+    def register_script(self, script):
+        call = self.redis.register_script(script)
+
+        async def run(**kwargs):
+            if self.failing:
+                raise ConnectionError('redis unavailable')
+            return await call(**kwargs)
+        return run
+
+    async def set(self, *args, **kwargs):
+        if self.failing:
+            raise ConnectionError('redis unavailable')
+        return await self.redis.set(*args, **kwargs)
+
+
+def test_transient_error_keeps_the_lease():
+    async def scenario():
+        redis = FlakyRedis(fakeredis.aioredis.FakeRedis(decode_responses=True))
+        first, second = LeaderLease(redis, ttl_ms=60_000), LeaderLease(redis, ttl_ms=60_000)
+        assert await first.check() and not await second.check()
+        redis.failing = True
+        assert await first.check()
+        redis.failing = False
+        assert await first.check() and not await second.check()
+
+    asyncio.run(scenario())
+
+
+def test_own_lease_is_taken_back():
+    async def scenario():
+        redis = FlakyRedis(fakeredis.aioredis.FakeRedis(decode_responses=True))
+        lease = LeaderLease(redis, ttl_ms=10)
+        assert await lease.check()
+        redis.failing = True
+        await asyncio.sleep(0.02)
+        # Could have expired meanwhile
+        assert not await lease.check()
+        redis.failing = False
+        await redis.redis.set(lease.key, lease.id)
+        assert await lease.check() and lease.is_leader
+
+    asyncio.run(scenario())
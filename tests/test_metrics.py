@@ -0,0 +1,26 @@
+import asyncio
+import json
+
+from bench.asgi import request
+from server.metrics import Metrics
+
+
+def test_series_are_labelled_with_the_worker():
+    metrics = Metrics(worker='host:1')
+    with metrics.timer('interact', 'decide'):
+        pass
+    metrics.inc('errors_total')
+    metrics.seen('farm')
+    text = metrics.render()
+    assert 'homefarm_handler_seconds_count{worker="host:1",handler="interact",stage="decide"} 1' in text
+    assert 'homefarm_errors_total{worker="host:1"} 1' in text
+    assert 'homefarm_active_boards{worker="host:1"} 1' in text
+
+
+def test_long_poll_marks_board_seen(main):
+    main.metrics.last_seen.pop('coco', None)
+    status, _, _ = asyncio.run(request(main.app, 'POST', '/interact/wait', json.dumps({'name': 'coco'}).encode(),
+                                       [('content-type', 'application/json')]))
+    assert status == 200
+    assert 'coco' in main.metrics.last_seen
+    assert ('interact_wait', 'decide') in main.metrics.histograms
@@ -0,0 +1,24 @@
+import asyncio
+
+from server.notify import BoardNotifier
+
+
+def test_events_are_dropped_with_last_waiter():
+    async def scenario():
+        notifier = BoardNotifier()
+        assert not await notifier.wait('nope', 0.01)
+        assert len(notifier) == 0
+
+        waiters = [asyncio.create_task(notifier.wait('coco', 0.05)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert len(notifier) == 1
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        notifier.notify('coco')
+        assert await asyncio.gather(*waiters[1:]) == [True, True]
+
+        late = asyncio.create_task(notifier.wait('coco', 0.01))
+        assert not await late
+        assert len(notifier) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import threading
+
+import orjson
+
+from server.publisher import Publisher
+
+
+class Broker:
+    """
+    In-process stand-in of the broker: fails the first `failures` sends
+    """
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def send(self, message: str) -> None:
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError('broker unavailable')
+            self.messages.append(orjson.loads(message))
+
+
+def test_publishes_in_order_with_retries():
+    broker = Broker(failures=2)
+    publisher = Publisher(broker.send, batch_size=4, retries=2, backoff_ms=1)
+    publisher.start()
+    for i in range(10):
+        publisher.publish({'id': i, 'data': {'value': i}})
+    publisher.stop()
+    assert [message['id'] for message in broker.messages] == list(range(10))
+    assert publisher.failed == 0 and publisher.dropped == 0
+
+
+def test_gives_up_after_retries():
+    broker = Broker(failures=3)
+    publisher = Publisher(broker.send, retries=2, backoff_ms=1)
+    publisher.publish({'id': 'lost'})
+    publisher.publish({'id': 'sent'})
+    while publisher.flush():
+        pass
+    assert publisher.failed == 1
+    assert broker.messages == [{'id': 'sent'}]
+
+
+def test_full_queue_drops_oldest():
+    broker = Broker()
+    publisher = Publisher(broker.send, max_queue=3)
+    for i in range(5):
+        publisher.publish({'id': i})
+    while publisher.flush():
+        pass
+    assert publisher.dropped == 2
+    assert [message['id'] for message in broker.messages] == [2, 3, 4]
+
+
+def test_unencodable_payload_is_reported_and_thread_survives():
+    broker = Broker()
+    publisher = Publisher(broker.send, backoff_ms=1)
+    publisher.start()
+    publisher.publish({'id': 1, 'data': {1j: 2}})
+    publisher.publish({'id': {2j}})
+    publisher.publish({'id': 3, 'data': 'ok'})
+    publisher.stop()
+    assert broker.messages[0]['id'] == 1 and 'error' in broker.messages[0]
+    assert broker.messages[1:] == [{'id': 3, 'data': 'ok'}]
+    assert publisher.failed == 1
@@ -0,0 +1,56 @@
+import os
+from time import sleep
+
+from server.result_cache import ResultCache
+
+
+def write(directory, name: str, size: int) -> str:
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(b'x' * size)
+    return name
+
+
+def test_sweep_deletes_expired_files(tmp_path):
+    cache = ResultCache(str(tmp_path), lifetime_sec=0.05, max_bytes=1000)
+    cache.add(write(tmp_path, 'a.csv', 10))
+    assert cache.sweep() == 0 and cache.touch('a.csv')
+    sleep(0.1)
+    # Re-added file gets a new expiry, the old heap item is stale
+    cache.add(write(tmp_path, 'b.csv', 10))
+    cache.add('b.csv')
+    assert not cache.touch('a.csv')
+    assert cache.sweep() == 1
+    assert os.listdir(tmp_path) == ['b.csv'] and cache.size == 10
+
+
+def test_eviction_by_size_in_lru_order(tmp_path):
+    cache = ResultCache(str(tmp_path), lifetime_sec=60, max_bytes=25)
+    for name in ('a', 'b'):
+        cache.add(write(tmp_path, name, 10))
+    cache.touch('a')
+    cache.add(write(tmp_path, 'c', 10))
+    assert sorted(os.listdir(tmp_path)) == ['a', 'c']
+    assert list(cache.entries) == ['a', 'c'] and cache.size == 20
+
+
+def test_lookup_by_key_survives_re_add(tmp_path):
+    cache = ResultCache(str(tmp_path), lifetime_sec=60, max_bytes=15)
+    result = {'result_grid': 'calc_grp/a'}
+    cache.add(write(tmp_path, 'a', 5), 'key', result)
+    cache.add('a', 'key', result)
+    assert cache.lookup('key') == result
+    # Callers get their own copy
+    cache.lookup('key')['result_grid'] = None
+    assert cache.lookup('key') == result
+    # Same inputs computed again into another file, evicting the first one keeps the key
+    cache.add(write(tmp_path, 'b', 5), 'key', {'result_grid': 'calc_grp/b'})
+    cache.add(write(tmp_path, 'c', 10))
+    assert 'a' not in cache.entries
+    assert cache.lookup('key') == {'result_grid': 'calc_grp/b'}
+
+
+def test_files_of_previous_run_are_adopted(tmp_path):
+    write(tmp_path, 'old', 10)
+    write(tmp_path, 'new.part', 10)
+    cache = ResultCache(str(tmp_path), lifetime_sec=60, max_bytes=100)
+    assert list(cache.entries) == ['old'] and cache.size == 10
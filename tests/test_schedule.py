@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+
+from server.schedule import (MINUTES_PER_DAY, ScheduleBook, build_schedules, compile_schedule, create_schedule,
+                             next_transitions, verify_equivalence)
+from server.registry import ScheduleConfig
+
+
+def test_compile_schedule_matches_create_schedule():
+    schedule = create_schedule([8, 9, 10], 5, 5)
+    bitmap = compile_schedule(schedule)
+    assert len(bitmap) == MINUTES_PER_DAY
+    assert bitmap[8 * 60:8 * 60 + 5] == b'\x01' * 5 and bitmap[8 * 60 + 5] == 0
+    assert bytes(bitmap) == bytes(build_schedules([(5, 5, [8, 9, 10])])[0])
+
+
+def test_compile_schedule_clips_invalid_intervals():
+    bitmap = compile_schedule({23: [(50, 70), (-5, 2), (30, 20)], 24: [(0, 10)]})
+    assert len(bitmap) == MINUTES_PER_DAY
+    assert sum(bitmap) == 10 + 3
+    next_transitions(np.array([bitmap], dtype=np.uint8))
+
+
+def test_malformed_row_does_not_break_other_schedules():
+    book = ScheduleBook()
+    book.compile_rows([ScheduleConfig(1, 23, '[(50, 70)]'),
+                       ScheduleConfig(2, 8, 'not a list'),
+                       ScheduleConfig(3, None, '[(0, 29)]')])
+    assert book.state(1, 23 * 60 + 59) == 1
+    assert sum(book.bitmaps[2]) == 0
+    assert book.state(3, 8 * 60 + 29) == 1 and book.next_transition(3, 8 * 60) == 30
+
+
+def test_build_schedules_matches_create_schedule():
+    rng = random.Random(0)
+    combinations = []
+    for _ in range(200):
+        # create_schedule() can't handle periods longer than an hour
+        work_time = rng.randint(1, 59)
+        sleep_time = rng.randint(1, 60 - work_time)
+        combinations.append((work_time, sleep_time, sorted(rng.sample(range(24), rng.randint(1, 24)))))
+    assert verify_equivalence(combinations) == []
+    assert verify_equivalence(combinations, start_minute=3) == []
@@ -0,0 +1,28 @@
+import asyncio
+import json
+
+from server.stream import StateStream
+
+
+def test_stream_survives_failed_load():
+    states = {'coco': {'coco_led': '1'}}
+    failures = [ConnectionError('redis blip')]
+
+    async def load(board):
+        if failures:
+            raise failures.pop()
+        return states[board]
+
+    async def scenario():
+        stream = StateStream(load, fps=100)
+        producer = asyncio.create_task(stream.run())
+        frames = stream.subscribe()
+        assert (await frames.__anext__()).startswith(b'event: snapshot')
+        stream.mark('coco')
+        frame = await asyncio.wait_for(frames.__anext__(), 3)
+        producer.cancel()
+        await frames.aclose()
+        return frame
+
+    frame = asyncio.run(scenario())
+    assert json.loads(frame[len(b'data: '):]) == {'coco': {'coco_led': '1'}}
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from influxdb import InfluxDBClient
+
+from db.tsdb.telemetry import TelemetryWriter, to_line
+
+
+class InfluxStandIn(BaseHTTPRequestHandler):
+    """
+    /write endpoint of InfluxDB: remembers written lines, fails with 500 while `failures` is positive,
+    then rejects with 400 while `rejects` is positive
+    """
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        server = self.server
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(500)
+        elif server.rejects > 0:
+            server.rejects -= 1
+            self.send_response(400)
+        else:
+            query = parse_qs(urlsplit(self.path).query)
+            server.writes.append((query['db'][0], query['precision'][0], body.splitlines()))
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def influx():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InfluxStandIn)
+    server.writes, server.failures, server.rejects = [], 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_to_line_escaping():
+    assert to_line('led temp', {'board': 'a,b'}, {'value': 1.5, 'n': 2, 'ok': True, 's': 'x"y'}, 7) == \
+        'led\\ temp,board=a\\,b value=1.5,n=2i,ok=true,s="x\\"y" 7'
+
+
+def test_writer_batches_and_retries(influx):
+    client = InfluxDBClient(host='127.0.0.1', port=influx.server_address[1], retries=1)
+    writer = TelemetryWriter(client, database='test', batch_size=3, flush_interval_ms=50, max_buffer=5)
+
+    async def scenario():
+        for i in range(7):
+            writer.append('led_temp', {'board': 'coco'}, {'value': float(i)}, timestamp_ms=i)
+        # Ring buffer keeps the newest 5 points
+        assert len(writer) == 5 and writer.dropped == 2
+        influx.failures = 1
+        await writer.flush()
+        assert writer.failed_flushes == 1 and len(writer) == 5
+        writer.start()
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert [(db, precision, len(lines)) for db, precision, lines in influx.writes] == [('test', 'ms', 3),
+                                                                                      ('test', 'ms', 2)]
+    assert influx.writes[0][2][0] == 'led_temp,board=coco value=2.0 2'
+    assert writer.written == 5
+
+
+def test_non_finite_values_are_rejected():
+    with pytest.raises(ValueError):
+        to_line('led_temp', {}, {'value': float('nan')}, 1)
+    writer = TelemetryWriter(InfluxDBClient(), database='test')
+    writer.append('led_temp', {'board': 'coco'}, {'value': float('inf')})
+    writer.append('led_temp', {'board': 'coco'}, {'value': 1.0})
+    assert len(writer) == 1 and writer.rejected == 1
+
+
+def test_rejected_batch_is_dropped(influx):
+    client = InfluxDBClient(host='127.0.0.1', port=influx.server_address[1], retries=1)
+    writer = TelemetryWriter(client, database='test', batch_size=2)
+
+    async def scenario():
+        for i in range(4):
+            writer.append('led_temp', {'board': 'coco'}, {'value': float(i)}, timestamp_ms=i)
+        influx.rejects = 1
+        await writer.flush()
+
+    asyncio.run(scenario())
+    assert writer.dropped_batches == 1 and writer.failed_flushes == 0 and len(writer) == 0
+    assert [lines for _, _, lines in influx.writes] == [['led_temp,board=coco value=2.0 2',
+                                                          'led_temp,board=coco value=3.0 3']]
@@ -0,0 +1,98 @@
+import asyncio
+from time import monotonic
+
+from server.registry import BoardConfig, Registry, ScheduleConfig, ThingConfig
+from server.triggers import Trigger
+
+
+def use_registry(main):
+    pump = ThingConfig(1, 'greenhouse', 'pump', 5, False, True, None, 7)
+    fan = ThingConfig(2, 'greenhouse', 'fan', 6, False, True, None, None)
+    motion = ThingConfig(3, 'greenhouse', 'motion', 7, False, False, None, None)
+    main.registry.current = Registry({'greenhouse': BoardConfig(1, 'greenhouse', '', (pump, fan, motion))},
+                                     (ScheduleConfig(7, None, '[(0, 30)]'),),
+                                     (Trigger(1, 3, 1, 1), Trigger(2, 3, 2, 1)))
+    main.on_registry_refresh(main.registry.current)
+
+
+def test_release_gives_thing_back_to_schedule(main):
+    use_registry(main)
+
+    async def scenario():
+        await main.triggers.on_reading(3, 1)
+        assert await main.redis.hgetall('greenhouse') == {'pump': '1', 'fan': '1'}
+        await main.triggers._release(main.triggers._by_sensor[3][0])
+        await main.triggers._release(main.triggers._by_sensor[3][1])
+        # Scheduled pump is back under its schedule, unscheduled fan is switched off
+        assert await main.redis.hgetall('greenhouse') == {'fan': '0'}
+        await main.journal.flush()
+
+    asyncio.run(scenario())
+    assert [record[2] for record in main.journal.history('greenhouse')] == [{'pump': 1}, {'fan': 1},
+                                                                            {'pump': None}, {'fan': 0}]
+    # Trigger values are never restored
+    assert main.journal.load() == {}
+
+
+def test_release_restores_user_override(main):
+    use_registry(main)
+
+    async def scenario():
+        await main.redis.hset('greenhouse', 'pump', 0)
+        await main.triggers.on_reading(3, 1)
+        await main.triggers._release(main.triggers._by_sensor[3][0])
+        assert (await main.redis.hgetall('greenhouse'))['pump'] == '0'
+
+    asyncio.run(scenario())
+
+
+def test_thing_is_restored_when_last_trigger_releases(main):
+    use_registry(main)
+    main.triggers.load(main.registry.current.triggers + (Trigger(3, 2, 1, 1),))
+
+    async def scenario():
+        await main.redis.hset('greenhouse', 'pump', 0)
+        await main.triggers.on_reading(3, 1)
+        await main.triggers.on_reading(2, 1)
+        await main.triggers._release(main.triggers._by_sensor[3][0])
+        assert (await main.redis.hgetall('greenhouse'))['pump'] == '1'
+        await main.triggers._release(main.triggers._by_sensor[2][0])
+        assert (await main.redis.hgetall('greenhouse'))['pump'] == '0'
+
+    asyncio.run(scenario())
+
+
+def test_new_leader_resumes_active_triggers(main):
+    use_registry(main)
+
+    async def scenario():
+        await main.redis.hset('greenhouse', 'pump', 0)
+        await main.triggers._fire(Trigger(4, 3, 1, 1, for_seconds=60))
+        await main.triggers._fire(Trigger(5, 3, 2, 1))
+        # Failover: the old leader is gone, another worker is elected
+        main.triggers.reset()
+        new = main.TriggerEngine(main.apply_trigger, main.restore_trigger, main.TriggerStore(main.redis))
+        new.load(main.registry.current.triggers + (Trigger(4, 3, 1, 1, for_seconds=60),))
+        await new.resume()
+        # Trigger 5 was deleted from the configuration meanwhile, its thing is released
+        assert await main.redis.hgetall('greenhouse') == {'pump': '1', 'fan': '0'}
+        # Timer is scheduled for what is left of for_seconds
+        assert 50 < new.timers.next_deadline() - monotonic() <= 60
+        await new._release(new._by_id[4])
+        assert (await main.redis.hgetall('greenhouse'))['pump'] == '0'
+        assert await main.redis.hgetall(main.CONFIG.active_triggers_key) == {}
+        assert await main.redis.hgetall(main.CONFIG.trigger_overrides_key) == {}
+
+    asyncio.run(scenario())
+
+
+def test_poll_hint_of_trigger_target_does_not_depend_on_worker(main):
+    use_registry(main)
+
+    async def scenario():
+        hint = await main.next_poll_ms('greenhouse')
+        # Timer of the fired trigger exists in the leader only
+        await main.triggers._fire(Trigger(3, 3, 2, 1, for_seconds=1))
+        assert await main.next_poll_ms('greenhouse') == hint == main.CONFIG.poll_interval_ms
+
+    asyncio.run(scenario())